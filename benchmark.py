@@ -0,0 +1,179 @@
+from PIL import Image
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from modifier import Modifier, cv2
+
+'''
+benchmark.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Times every effect of modifier.py over images of several sizes, made from Examples/test.JPG
+'''
+
+# name: (width, height), from a thumbnail up to 50 megapixels
+SIZES = {
+    'thumbnail': (320, 240),
+    '1mp': (1280, 800),
+    '12mp': (4000, 3000),
+    '50mp': (8660, 5774),
+}
+# name: params, every effect of Modifier with its default arguments
+EFFECTS = {
+    'negative': {},
+    'mirror_vertical': {},
+    'mirror_horizontal': {},
+    'mirror_diagonal': {},
+    'grayscale': {},
+    'sepia': {},
+    'average': {},
+    'halftone': {},
+    'dither': {},
+    'primary': {},
+    'tint': {},
+    'recolor': {},
+    'rotate': {},
+    'detect_edges': {},
+    'deepfry': {},
+    'blur': {},
+    'sharpen': {},
+    'emboss': {},
+    'cool': {},
+    'warm': {},
+    'brightness': {},
+    'black_border': {},
+    'white_border': {},
+    'cartoon': {},
+    'curve': {'name': 'benchmark'},
+}
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples', 'test.JPG')
+
+def synthesize(size: str, directory: str) -> str:
+    '''
+    Creates the test image of the named size in directory, resampled from Examples/test.JPG, unless it is already there
+    Returns the path of the image
+    '''
+    path = os.path.join(directory, 'benchmark-%s.jpg' % size)
+    if not os.path.exists(path):
+        with Image.open(SOURCE) as source:
+            source.convert('RGB').resize(SIZES[size], Image.LANCZOS).save(path, quality=95)
+    return path
+
+def measure(path: str, effect: str, repeat: int) -> dict:
+    '''
+    Decodes the image at path, runs effect on it, and encodes the result to JPEG in memory, repeat times
+    Returns the median seconds of each stage, and the peak resident memory of the process in bytes,
+    before (after importing) and after measuring
+    Runs in a fresh worker process, so the peak belongs to this effect and size alone
+    '''
+    # OpenCV is imported on first use, so it is loaded here to keep it out of the effect's memory and first repeat
+    cv2.getNumThreads()
+    imported = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    Modifier.register_curve('benchmark', np.interp(np.arange(256), [0, 64, 128, 192, 255], [0, 80, 150, 210, 255]))
+    stages = {'decode': [], 'transform': [], 'encode': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        modifier = Modifier(path)
+        pixels = modifier.pixels
+        decoded = time.perf_counter()
+        chained = getattr(modifier.pipeline(), effect)(**EFFECTS[effect])
+        chained.pixels
+        transformed = time.perf_counter()
+        chained.to_bytes()
+        encoded = time.perf_counter()
+        stages['decode'].append(decoded - start)
+        stages['transform'].append(transformed - decoded)
+        stages['encode'].append(encoded - transformed)
+    result = {stage: float(np.median(seconds)) for stage, seconds in stages.items()}
+    result['total'] = result['decode'] + result['transform'] + result['encode']
+    result['megapixels'] = pixels.shape[0] * pixels.shape[1] / 1e6
+    result['megapixels_per_second'] = result['megapixels'] / result['total']
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    result['import_rss'] = imported * unit
+    result['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    return result
+
+def run(sizes: list, effects: list, repeat: int = 3, directory: str = None) -> dict:
+    '''
+    Measures each effect at each size, see measure
+    Images are made in directory, defaults to a temporary directory
+    Returns the results with a description of the machine, ready to be written as JSON
+    '''
+    directory = directory or os.path.join(tempfile.gettempdir(), 'modifier-benchmark')
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    # a fresh process per measurement, as the peak resident memory of a process never goes down,
+    # spawned so it does not inherit the memory of this one
+    with ProcessPoolExecutor(1, multiprocessing.get_context('spawn'), max_tasks_per_child=1) as executor:
+        for size in sizes:
+            # made in a worker too, since the peak memory of this process would pass on to the next ones
+            path = executor.submit(synthesize, size, directory).result()
+            for effect in effects:
+                result = executor.submit(measure, path, effect, repeat).result()
+                results.append({'size': size, 'effect': effect, **result})
+                print('%-10s %-18s %8.3fs %8.2f MP/s %8.1f MiB peak, %8.1f MiB over imports  (decode %.3fs, transform %.3fs, encode %.3fs)' % (
+                    size, effect, result['total'], result['megapixels_per_second'], result['peak_rss'] / 2**20, (result['peak_rss'] - result['import_rss']) / 2**20,
+                    result['decode'], result['transform'], result['encode']
+                ), file=sys.stderr)
+    return {
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'repeat': repeat,
+        'results': results,
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    '''
+    Compares the total time of each effect and size measured in both runs
+    Returns a message for each one that is slower than the baseline by more than threshold, a fraction
+    '''
+    previous = {(result['size'], result['effect']): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get((result['size'], result['effect']))
+        if old is not None and result['total'] > old['total'] * (1 + threshold):
+            regressions.append('%s %s: %.3fs, was %.3fs (%+.0f%%)' % (
+                result['size'], result['effect'], result['total'], old['total'], 100 * (result['total'] / old['total'] - 1)
+            ))
+    return regressions
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='python benchmark.py', description='Time every effect of modifier.py at several image sizes')
+    parser.add_argument('-s', '--sizes', nargs='+', choices=list(SIZES), default=list(SIZES), help='image sizes to run, defaults to all')
+    parser.add_argument('-e', '--effects', nargs='+', choices=list(EFFECTS), default=list(EFFECTS), help='effects to run, defaults to all')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs of each measurement, the median is kept, defaults to 3')
+    parser.add_argument('-o', '--output', help='file to write the results to as JSON')
+    parser.add_argument('-b', '--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=.1, help='slowdown over the baseline that fails the run, defaults to 0.1 for 10%%')
+    parser.add_argument('--workdir', help='directory for the test images, defaults to a temporary directory')
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.effects, args.repeat, args.workdir)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print('regression: ' + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,26 @@
-from PIL import Image, ImageFilter, ImageOps, ImageEnhance
+from PIL import Image, ImageFilter, ImageOps, ImageSequence, GifImagePlugin, UnidentifiedImageError
 import warnings
-import cv2
+import io
+import os
+import sys
+import ast
+import glob
+import time
+import json
+import hashlib
+import threading
+import weakref
+import contextvars
+import zlib
+import struct
+import shutil
+import argparse
+import inspect
+import subprocess
+import importlib
+from collections import namedtuple, deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import numpy as np
-from scipy.interpolate import UnivariateSpline as uspline
 
 '''
 modifier.py
@@ -19,11 +37,1105 @@ The current maintainer of this work is RandomKiddo
 This work only consists of this python file and any example images created
 '''
 
+class _Backend:
+    # the named module, imported on its first use rather than here, or fallback when it cannot be imported,
+    # which covers a module that is installed but fails to load, such as OpenCV without libGL
+    def __init__(self, name: str, fallback = None):
+        self.__name = name
+        self.__fallback = fallback
+        self.__module = None
+    def __getattr__(self, attribute: str):
+        return getattr(self.resolve(), attribute)
+    def resolve(self):
+        if self.__module is None:
+            try:
+                module = importlib.import_module(self.__name)
+            except ImportError as error:
+                if self.__fallback is None:
+                    raise
+                if not (isinstance(error, ModuleNotFoundError) and error.name == self.__name):
+                    warnings.warn('%s could not be imported (%s), using %s instead' % (self.__name, error, self.__fallback.__name__))
+                module = self.__fallback
+            self.__module = module
+            # later uses in this module skip the proxy
+            if globals().get(self.__name) is self:
+                globals()[self.__name] = module
+        return self.__module
+
+class _PillowBackend:
+    # the parts of OpenCV that Modifier uses, with Pillow and NumPy, for when OpenCV is not installed
+    # filters match OpenCV's inside the image but may differ slightly at its edges, and the bilateral filter
+    # is a box blur, which is what it becomes at the wide color sigma cartoon uses
+    INTER_AREA, INTER_LINEAR, INTER_CUBIC = Image.BOX, Image.BILINEAR, Image.BICUBIC
+    BORDER_CONSTANT, BORDER_REPLICATE = 'constant', 'edge'
+    COLOR_RGB2GRAY, COLOR_GRAY2RGB, COLOR_RGB2BGR, COLOR_BGR2RGB = 'RGB2GRAY', 'GRAY2RGB', 'RGB2BGR', 'BGR2RGB'
+    ADAPTIVE_THRESH_MEAN_C, THRESH_BINARY = 'mean', 'binary'
+    # results are writable copies, as OpenCV's are
+    def __image(pixels: np.ndarray) -> Image:
+        return Image.fromarray(np.ascontiguousarray(pixels))
+    @staticmethod
+    # dst is taken for OpenCV's signatures, a new array is returned, except by LUT, which writes in place
+    def LUT(src: np.ndarray, lut: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+        lut = lut.reshape(256, -1)
+        if src.ndim == 2 or lut.shape[1] == 1:
+            looked = lut[src, 0] if src.ndim == 2 else lut[src[..., 0], 0]
+        else:
+            looked = lut[src, np.arange(src.shape[2])]
+        if dst is None or dst.shape != looked.shape:
+            return looked
+        np.copyto(dst, looked)
+        return dst
+    @staticmethod
+    def calcHist(images: list, channels: list, mask, histSize: list, ranges: list) -> np.ndarray:
+        return np.bincount(images[0][..., channels[0]].ravel(), minlength=256).astype(np.float32)
+    @staticmethod
+    def GaussianBlur(src: np.ndarray, ksize: tuple, sigmaX: float, dst: np.ndarray = None) -> np.ndarray:
+        # Pillow's radius is the standard deviation, a sigma of 0 is derived from the kernel size as OpenCV does
+        sigma = sigmaX or .3 * ((ksize[0] - 1) * .5 - 1) + .8
+        return np.array(_PillowBackend.__image(src).filter(ImageFilter.GaussianBlur(sigma)))
+    @staticmethod
+    def blur(src: np.ndarray, ksize: tuple, dst: np.ndarray = None) -> np.ndarray:
+        return np.array(_PillowBackend.__image(src).filter(ImageFilter.BoxBlur((ksize[0] - 1) / 2)))
+    @staticmethod
+    def bilateralFilter(src: np.ndarray, d: int, sigmaColor: float, sigmaSpace: float, dst: np.ndarray = None) -> np.ndarray:
+        return _PillowBackend.blur(src, (d, d))
+    @staticmethod
+    def medianBlur(src: np.ndarray, ksize: int, dst: np.ndarray = None) -> np.ndarray:
+        return np.array(_PillowBackend.__image(src).filter(ImageFilter.MedianFilter(ksize)))
+    @staticmethod
+    def filter2D(src: np.ndarray, ddepth: int, kernel: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+        # Pillow runs a kernel bottom row first, so the rows are flipped to match OpenCV, and edges are reflected as there
+        size = kernel.shape[0]
+        reach = size // 2
+        padded = np.pad(src, ((reach, reach), (reach, reach)) + ((0, 0),) * (src.ndim - 2), mode='reflect')
+        flipped = ImageFilter.Kernel((size, size), kernel[::-1].flatten().tolist(), scale=1, offset=0)
+        return np.array(_PillowBackend.__image(padded).filter(flipped))[reach:-reach, reach:-reach]
+    @staticmethod
+    def resize(src: np.ndarray, dsize: tuple, dst: np.ndarray = None, interpolation: int = Image.BILINEAR) -> np.ndarray:
+        return np.array(_PillowBackend.__image(src).resize(dsize, interpolation))
+    @staticmethod
+    def copyMakeBorder(src: np.ndarray, top: int, bottom: int, left: int, right: int, borderType: str, dst: np.ndarray = None, value: tuple = (0, 0, 0)) -> np.ndarray:
+        pad = ((top, bottom), (left, right)) + ((0, 0),) * (src.ndim - 2)
+        if borderType == _PillowBackend.BORDER_REPLICATE:
+            return np.pad(src, pad, mode='edge')
+        bordered = np.empty((src.shape[0] + top + bottom, src.shape[1] + left + right) + src.shape[2:], src.dtype)
+        bordered[...] = value[:src.shape[2]] if src.ndim == 3 else value[0]
+        bordered[top:top + src.shape[0], left:left + src.shape[1]] = src
+        return bordered
+    @staticmethod
+    def cvtColor(src: np.ndarray, code: str, dst: np.ndarray = None) -> np.ndarray:
+        if code == _PillowBackend.COLOR_RGB2GRAY:
+            converted = np.array(_PillowBackend.__image(src).convert('L'))
+        elif code == _PillowBackend.COLOR_GRAY2RGB:
+            converted = np.repeat(src[:, :, np.newaxis], 3, axis=2)
+        else:
+            converted = np.ascontiguousarray(src[:, :, ::-1])
+        return converted
+    @staticmethod
+    def adaptiveThreshold(src: np.ndarray, maxValue: int, adaptiveMethod: str, thresholdType: str, blockSize: int, C: float, dst: np.ndarray = None) -> np.ndarray:
+        # the rounded mean of each block, from running sums over replicated edges
+        reach = blockSize // 2
+        sums = np.pad(np.pad(src.astype(np.int64), reach, mode='edge').cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        block = sums[blockSize:, blockSize:] - sums[:-blockSize, blockSize:] - sums[blockSize:, :-blockSize] + sums[:-blockSize, :-blockSize]
+        mean = np.rint(block / blockSize ** 2).astype(np.int64)
+        return np.where(src.astype(np.int64) - mean > -C, maxValue, 0).astype(np.uint8)
+    @staticmethod
+    def bitwise_and(src1: np.ndarray, src2: np.ndarray, dst: np.ndarray = None, mask: np.ndarray = None) -> np.ndarray:
+        both = src1 & src2
+        if mask is None:
+            return both
+        return np.where((mask != 0)[..., np.newaxis] if both.ndim == 3 else mask != 0, both, 0).astype(both.dtype)
+    @staticmethod
+    def split(m: np.ndarray) -> tuple:
+        return tuple(np.ascontiguousarray(m[:, :, channel]) for channel in range(m.shape[2]))
+    @staticmethod
+    def merge(mv: list, dst: np.ndarray = None) -> np.ndarray:
+        return np.stack(mv, axis=2)
+    @staticmethod
+    def addWeighted(src1: np.ndarray, alpha: float, src2: np.ndarray, beta: float, gamma: float, dst: np.ndarray = None) -> np.ndarray:
+        return np.clip(np.rint(src1 * float(alpha) + src2 * float(beta) + gamma), 0, 255).astype(np.uint8)
+    @staticmethod
+    def convertScaleAbs(src: np.ndarray, dst: np.ndarray = None, alpha: float = 1, beta: float = 0) -> np.ndarray:
+        return np.clip(np.rint(np.abs(src * float(alpha) + beta)), 0, 255).astype(np.uint8)
+    @staticmethod
+    def Canny(image: np.ndarray, threshold1: float, threshold2: float, edges: np.ndarray = None) -> np.ndarray:
+        # Sobel gradients of the strongest channel, thinned to their ridges, then weak edges kept only where they touch strong ones
+        pixels = image.astype(np.int32)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, np.newaxis]
+        padded = np.pad(pixels, ((1, 1), (1, 1), (0, 0)), mode='reflect')
+        dx = padded[:-2, 2:] + 2 * padded[1:-1, 2:] + padded[2:, 2:] - padded[:-2, :-2] - 2 * padded[1:-1, :-2] - padded[2:, :-2]
+        dy = padded[2:, :-2] + 2 * padded[2:, 1:-1] + padded[2:, 2:] - padded[:-2, :-2] - 2 * padded[:-2, 1:-1] - padded[:-2, 2:]
+        magnitude = np.abs(dx) + np.abs(dy)
+        channel = magnitude.argmax(axis=2)[:, :, np.newaxis]
+        dx, dy, magnitude = (np.take_along_axis(array, channel, axis=2)[:, :, 0] for array in (dx, dy, magnitude))
+        around = np.pad(magnitude, 1)
+        height, width = magnitude.shape
+        def neighbor(y: int, x: int) -> np.ndarray:
+            return around[1 + y:1 + y + height, 1 + x:1 + x + width]
+        # the two neighbors across the edge, by the gradient direction rounded to 45 degrees
+        horizontal = np.abs(dy) * 2.4142 < np.abs(dx)
+        vertical = np.abs(dy) > np.abs(dx) * 2.4142
+        falling = dx * dy > 0
+        first = np.where(horizontal, neighbor(0, -1), np.where(vertical, neighbor(-1, 0), np.where(falling, neighbor(-1, -1), neighbor(-1, 1))))
+        second = np.where(horizontal, neighbor(0, 1), np.where(vertical, neighbor(1, 0), np.where(falling, neighbor(1, 1), neighbor(1, -1))))
+        ridge = (magnitude > threshold1) & (magnitude > first) & (magnitude >= second)
+        edges = ridge & (magnitude > threshold2)
+        while True:
+            grown = np.pad(edges, 1)
+            grown = ridge & np.any([grown[1 + y:1 + y + height, 1 + x:1 + x + width] for y in (-1, 0, 1) for x in (-1, 0, 1)], axis=0)
+            if np.array_equal(grown, edges):
+                return np.where(edges, 255, 0).astype(np.uint8)
+            edges = grown
+    @staticmethod
+    def getNumThreads() -> int:
+        return 1
+    @staticmethod
+    def setNumThreads(nthreads: int) -> None:
+        pass
+    @staticmethod
+    def VideoCapture(*args):
+        raise ModuleNotFoundError('reading videos needs OpenCV, which can be installed with pip install opencv-python')
+    @staticmethod
+    def VideoWriter_fourcc(*args):
+        raise ModuleNotFoundError('writing videos needs OpenCV, which can be installed with pip install opencv-python')
+
+# OpenCV is imported when an effect first uses it, and Pillow and NumPy stand in for it when it is not installed
+cv2 = _Backend('cv2', _PillowBackend)
+# only AsyncModifier needs asyncio
+asyncio = _Backend('asyncio')
+
+# outcome of one file in Modifier.batch, error is None on success
+BatchResult = namedtuple('BatchResult', ['inputpath', 'outputpath', 'error', 'seconds', 'pixels'])
+# one timed stage of a modifier, passed to hooks, effect is None for stages outside an effect
+StageRecord = namedtuple('StageRecord', ['stage', 'effect', 'seconds', 'pixels', 'bytes'])
+
 class Modifier:
-    def __init__(self, inputpath: str):
-        self.image = Image.open(inputpath)
-        self.image = self.image.convert('RGB')
+    # Pixels are held once per modifier as a read-only RGB uint8 array (or a 2D gray array)
+    # OpenCV calls take this buffer directly, anything that depends on BGR order goes through __bgr
+    __SEPIA = np.array([[.393, .769, .189], [.349, .686, .168], [.272, .534, .131]])
+    # right-angle geometry as (transpose, flip rows, flip columns), applied in that order
+    __IDENTITY = (False, False, False)
+    # jpegtran switches for each right-angle geometry, jpegtran rotates clockwise
+    __JPEGTRAN = {
+        (False, False, False): [],
+        (False, True, False): ['-flip', 'vertical'],
+        (False, False, True): ['-flip', 'horizontal'],
+        (False, True, True): ['-rotate', '180'],
+        (True, False, False): ['-transpose'],
+        (True, True, False): ['-rotate', '270'],
+        (True, False, True): ['-rotate', '90'],
+        (True, True, True): ['-transverse'],
+    }
+    def __init__(self, inputpath: str = None, lazy: bool = False, image: Image = None, pixels: np.ndarray = None, inplace: bool = False):
+        '''
+        Creates a modifier of the image at inputpath, of an in-memory PIL image, or of an RGB pixel array
+        Bool lazy can be passed in to record chained effects instead of saving each one,
+        the result is then encoded once by save or to_bytes
+        Effects called with outputpath None keep their result in memory without writing a file
+        Bool inplace can be passed in to let effects write over this instance's pixels, including a given pixel array,
+        and hand its buffer back to the pool once an effect has read it, see use_pool
+        This instance's pixels must then not be used after an effect is called on it
+        '''
+        self.__file = None
+        self.__data = None
+        self.__digest = None
+        self.__image = None
+        if pixels is None and image is None:
+            # only the header is parsed here, the pixels are decoded on first use
+            start = Modifier.__clock()
+            with open(inputpath, 'rb') as file:
+                self.__data = file.read()
+            if start is not None:
+                Modifier.__record('read', None, start, 0, len(self.__data))
+            try:
+                image = Image.open(io.BytesIO(self.__data))
+            except UnidentifiedImageError:
+                raise UnidentifiedImageError('cannot identify image file %r' % inputpath) from None
+            self.__file = inputpath
+        elif pixels is None and image.mode == 'RGB':
+            self.__image = image
+        elif pixels is not None and pixels.flags.writeable:
+            pixels = pixels.view()
+            pixels.flags.writeable = False
+        self.__source = pixels
+        self.__decoder = image if pixels is None else None
+        self.__plan = ()
+        self.__outputpath = None
+        self.__options = {}
         self.inputpath = inputpath
+        self.lazy = lazy
+        self.inplace = inplace
+    @property
+    def pixels(self) -> np.ndarray:
+        '''
+        The read-only pixel array of this instance, running any pending lazy effects first
+        '''
+        if self.__plan:
+            source = self.__decode()
+            rendered = Modifier.__render(source, self.__plan, self.inplace)
+            if not self.inplace and Modifier.__borrowed(rendered, source):
+                # a mirror or rotation is a view of its input, which the modifier it came from may release to the pool
+                copied = Modifier.__take(rendered.shape, rendered.dtype)
+                if copied is None:
+                    copied = np.empty(rendered.shape, rendered.dtype)
+                np.copyto(copied, rendered)
+                copied.flags.writeable = False
+                rendered = copied
+            self.__source = rendered
+            self.__plan = ()
+            self.__image = None
+            # the file no longer holds this instance's pixels
+            self.__data = self.__digest = None
+        return self.__decode()
+    @property
+    def image(self) -> Image:
+        '''
+        The PIL image of this instance, running any pending lazy effects first
+        '''
+        pixels = self.pixels
+        if self.__image is None:
+            self.__image = Modifier.__to_image(pixels)
+        return self.__image
+    def pipeline(self):
+        '''
+        Returns a lazy modifier of this instance's image
+        Effects called on it are recorded, and run in memory on save or to_bytes
+        '''
+        chained = Modifier.__new__(Modifier)
+        chained.__dict__.update(self.__dict__)
+        chained.lazy = True
+        return chained
+    def histogram(self, approximate: bool = False) -> np.ndarray:
+        '''
+        Returns the 256 bin histogram of each channel of this instance's image, as a 3x256 array
+        Bool approximate can be passed in to count a reduced JPEG decode or a subsample instead
+        '''
+        return Modifier.__histogram(self.__sample(approximate))
+    def statistics(self, percentiles: tuple = (1, 5, 50, 95, 99), approximate: bool = False) -> dict:
+        '''
+        Returns the pixel count, and the per channel mean, min, max, percentiles and histogram of this instance's image
+        Percentiles can be passed in as values from 0 to 100, defaults to 1, 5, 50, 95, and 99
+        Bool approximate can be passed in to measure a reduced JPEG decode or a subsample instead
+        All of it is derived from one histogram of the image
+        '''
+        histogram = self.histogram(approximate)
+        count = int(histogram[0].sum())
+        cumulative = histogram.cumsum(axis=1)
+        present = histogram > 0
+        def percentile(value: float) -> tuple:
+            rank = max(1, int(np.ceil(value * count / 100)))
+            return tuple(int(np.searchsorted(cumulative[channel], rank)) for channel in range(3))
+        return {
+            'pixels': count,
+            'mean': tuple(float(mean) for mean in histogram @ np.arange(256) / count),
+            'min': tuple(int(channel.argmax()) for channel in present),
+            'max': tuple(int(255 - channel[::-1].argmax()) for channel in present),
+            'percentiles': {value: percentile(value) for value in percentiles},
+            'histogram': histogram,
+        }
+    # pixels measured by approximate statistics of an image that is already decoded
+    __SAMPLES = 2**16
+    def __decode(self) -> np.ndarray:
+        if self.__source is None:
+            start = Modifier.__clock()
+            image = self.__decoder
+            self.__source = Modifier.__to_array(image if image.mode == 'RGB' else image.convert('RGB'))
+            self.__decoder = None
+            if self.__data is not None:
+                # the encoded file is only needed for a draft or a cache key, neither of which outlives the decode
+                if Modifier.__cache is not None and self.__digest is None:
+                    self.__digest = hashlib.sha256(self.__data).hexdigest()
+                self.__data = None
+            if start is not None:
+                Modifier.__record('decode', None, start, image.width * image.height, self.__source.nbytes)
+        return self.__source
+    def __shape(self) -> tuple:
+        if self.__source is None:
+            return (self.__decoder.height, self.__decoder.width, 3)
+        return self.__source.shape
+    def __sample(self, approximate: bool) -> np.ndarray:
+        if not approximate:
+            return self.pixels
+        if self.__source is None and not self.__plan and self.__data is not None and self.__decoder.format == 'JPEG':
+            # DCT scaled decoding at an eighth of the size, from a second reader so the full decode is untouched
+            start = Modifier.__clock()
+            draft = Image.open(io.BytesIO(self.__data))
+            draft.draft('RGB', (draft.width // 8, draft.height // 8))
+            pixels = Modifier.__to_array(draft.convert('RGB'))
+            if start is not None:
+                Modifier.__record('draft', None, start, pixels.shape[0] * pixels.shape[1], pixels.nbytes)
+            return pixels
+        pixels = self.pixels
+        step = max(1, int((pixels.shape[0] * pixels.shape[1] / Modifier.__SAMPLES) ** .5))
+        return pixels[::step, ::step]
+    def __histogram(pixels: np.ndarray) -> np.ndarray:
+        # calcHist counts in float32, which is exact below 2**24, so large images are counted in row chunks
+        pixels = np.ascontiguousarray(Modifier.__color(pixels))
+        rows = max(1, 2**24 // pixels.shape[1])
+        histogram = np.zeros((3, 256), dtype=np.int64)
+        for top in range(0, pixels.shape[0], rows):
+            chunk = pixels[top:top+rows]
+            for channel in range(3):
+                histogram[channel] += cv2.calcHist([chunk], [channel], None, [256], [0, 256]).reshape(256).astype(np.int64)
+        return histogram
+    def save(self, outputpath = None, show: bool = False, lossless: bool = False, format: str = None, **options):
+        '''
+        Runs any pending lazy effects and encodes the result once
+        Output goes to filename or writable file object outputpath, defaults to the output name of the last effect
+        Bool can be passed in if image should be shown upon finishing
+        Bool lossless can be passed in to flip and rotate a JPEG file into a JPEG file with jpegtran,
+        without decoding it, when every pending effect is a mirror or right-angle rotation
+        Format can be passed in to override the one given by the file name, file objects without a name default to JPEG
+        Encoder options such as quality, subsampling, progressive, and optimize can be passed in, see Pillow's image.save
+        Returns a modifier of the output image, kept in memory
+        '''
+        outputpath = outputpath or self.__outputpath
+        if outputpath is None:
+            raise ValueError('outputpath is required when no effect has been applied')
+        start = Modifier.__clock()
+        if lossless and Modifier.__is_path(outputpath) and self.__jpegtran(outputpath):
+            if start is not None:
+                Modifier.__record('jpegtran', None, start, 0, os.path.getsize(outputpath))
+            saved = Modifier(outputpath)
+            if show:
+                saved.image.show()
+            return saved
+        if format is None and not Modifier.__is_path(outputpath) and not hasattr(outputpath, 'name'):
+            format = 'JPEG'
+        options = {**self.__options, **options}
+        key = self.__key(outputpath, format, options)
+        if key is not None:
+            data = Modifier.__cache.get(key[0])
+            if data is not None:
+                # a cached result is written as it is, without decoding the input
+                if start is not None:
+                    Modifier.__record('cache', None, start, 0, len(data))
+                Modifier.__write(outputpath, data)
+                saved = Modifier(outputpath) if Modifier.__is_path(outputpath) else Modifier(image=Image.open(io.BytesIO(data)))
+                if show:
+                    saved.image.show()
+                return saved
+        image = self.image
+        start = Modifier.__clock()
+        # writes to a file object are counted as they pass, as a pipe or socket cannot tell its position
+        target = outputpath if start is None or Modifier.__is_path(outputpath) else _Counter(outputpath)
+        if key is None:
+            image.save(target, format=format, **options)
+        else:
+            buffer = io.BytesIO()
+            image.save(buffer, format=key[1], **options)
+            Modifier.__write(target, buffer.getvalue())
+            Modifier.__cache.put(key[0], buffer.getvalue())
+        if start is not None:
+            written = os.path.getsize(outputpath) if target is outputpath else target.written
+            Modifier.__record('encode', None, start, image.width * image.height, written)
+        if show:
+            image.show()
+        return Modifier(outputpath if Modifier.__is_path(outputpath) else None, image=image, pixels=self.pixels)
+    def to_bytes(self, format: str = 'JPEG', **options) -> bytes:
+        '''
+        Runs any pending lazy effects and returns the result encoded in the given format
+        Format defaults to JPEG, and can be any format Pillow writes, such as PNG or WEBP
+        Encoder options such as quality, subsampling, progressive, and optimize can be passed in, see Pillow's image.save
+        '''
+        buffer = io.BytesIO()
+        self.save(buffer, format=format, **options)
+        return buffer.getvalue()
+    def __is_path(outputpath) -> bool:
+        return isinstance(outputpath, (str, os.PathLike))
+    def __write(outputpath, data: bytes) -> None:
+        if Modifier.__is_path(outputpath):
+            with open(outputpath, 'wb') as file:
+                file.write(data)
+        else:
+            outputpath.write(data)
+    __cache = None
+    @staticmethod
+    def use_cache(cache) -> None:
+        '''
+        Sets the ResultCache that save, to_bytes, and effects look up encoded results in, None turns caching off
+        Results are keyed by a hash of the input file or pixels, the effects and their params, the format, and the encoder options
+        '''
+        Modifier.__cache = cache
+    def __key(self, outputpath, format: str, options: dict) -> tuple:
+        # (cache key, format) of the result, or None when caching is off or the format is not known yet
+        if Modifier.__cache is None:
+            return None
+        if format is None:
+            name = os.fspath(outputpath) if Modifier.__is_path(outputpath) else getattr(outputpath, 'name', '')
+            format = Image.registered_extensions().get(os.path.splitext(str(name))[1].lower())
+            if format is None:
+                return None
+        if self.__digest is None:
+            if self.__data is not None:
+                self.__digest = hashlib.sha256(self.__data).hexdigest()
+            else:
+                pixels = np.ascontiguousarray(self.__decode())
+                self.__digest = hashlib.sha256(repr(pixels.shape).encode() + pixels.data).hexdigest()
+        plan = []
+        for effect, params in self.__plan:
+            params = sorted(params.items())
+            if effect == 'curve':
+                # a curve can be registered again under the same name
+                params.append(('table', hashlib.sha256(Modifier.__curves[dict(params)['name']]).hexdigest()))
+            plan.append((effect, params))
+        key = repr((self.__digest, plan, format.upper(), sorted(options.items())))
+        return hashlib.sha256(key.encode()).hexdigest(), format
+    # callbacks given a StageRecord for each stage, when there are none nothing is timed
+    __hooks = []
+    @staticmethod
+    def add_hook(hook) -> None:
+        '''
+        Registers a callback that is given a StageRecord(stage, effect, seconds, pixels, bytes) for each timed stage,
+        from reading and decoding through each effect to encoding, in whichever thread ran the stage
+        Bytes are those read or written for reading and encoding, and those of the new pixel buffer otherwise
+        '''
+        Modifier.__hooks.append(hook)
+    @staticmethod
+    def remove_hook(hook) -> None:
+        '''
+        Unregisters a callback registered with add_hook
+        '''
+        Modifier.__hooks.remove(hook)
+    @staticmethod
+    def profile():
+        '''
+        Returns a Profile, a context manager that records every stage run inside it, see add_hook
+        '''
+        return Profile()
+    def __clock() -> float:
+        return time.perf_counter() if Modifier.__hooks else None
+    def __record(stage: str, effect: str, start: float, pixels: int, size: int) -> None:
+        record = StageRecord(stage, effect, time.perf_counter() - start, pixels, size)
+        for hook in tuple(Modifier.__hooks):
+            hook(record)
+    def __apply(self, effect: str, outputpath: str, show: bool, lossless: bool = False, **params):
+        chained = self.pipeline()
+        chained.__plan += ((effect, params),)
+        chained.__outputpath = outputpath
+        chained.__options = Modifier.__effects[effect][1]
+        if self.lazy:
+            return chained
+        if outputpath is None:
+            # no file is written, the result stays in memory
+            if show:
+                chained.image.show()
+            return Modifier(image=chained.image, pixels=chained.pixels, inplace=self.inplace)
+        saved = chained.save(outputpath, show, lossless)
+        # a file written by jpegtran has already been decoded from disk, and file objects are not read back
+        return saved if saved.__file is not None or not Modifier.__is_path(outputpath) else Modifier(outputpath)
+    def __render(pixels: np.ndarray, plan: tuple, inplace: bool = False) -> np.ndarray:
+        # runs of mirrors and right-angle rotations are merged into one geometry, applied as a view,
+        # and runs of point effects into one lookup table, the two commute so they may interleave
+        # intermediates go back to the pool once read, and so does the input when inplace
+        source = None if inplace else pixels
+        geometry = Modifier.__IDENTITY
+        table = None
+        merged = []
+        for effect, params in plan:
+            steps = Modifier.__geometry(effect, params, pixels.shape)
+            if steps is not None:
+                geometry = Modifier.__compose_all(steps, geometry)
+                merged.append(effect)
+                continue
+            lookup = Modifier.__table(effect, params)
+            if lookup is not None:
+                table = lookup if table is None else Modifier.__fuse(table, lookup)
+                merged.append(effect)
+                continue
+            pixels = Modifier.__flush(pixels, geometry, table, merged, source)
+            geometry, table, merged = Modifier.__IDENTITY, None, []
+            start = Modifier.__clock()
+            size = pixels.shape[0] * pixels.shape[1]
+            colored = Modifier.__color(pixels)
+            transformed = Modifier.__transform(effect, params, colored)
+            Modifier.__recycle((pixels, colored), transformed, source)
+            pixels = transformed
+            if start is not None:
+                Modifier.__record('transform', effect, start, size, pixels.nbytes)
+        pixels = Modifier.__flush(pixels, geometry, table, merged, source)
+        pixels.flags.writeable = False
+        return pixels
+    def __flush(pixels: np.ndarray, geometry: tuple, table: np.ndarray, merged: list = (), source: np.ndarray = None) -> np.ndarray:
+        # merged names the effects folded into the table and geometry, recorded as one stage
+        # the table is applied in place unless the pixels share the source, which must be kept
+        start = Modifier.__clock() if merged else None
+        flushed = pixels
+        if table is not None:
+            colored = Modifier.__color(pixels)
+            keep = source is not None and np.may_share_memory(colored, source) or not Modifier.__writable(colored)
+            bands = Modifier.__bands((), colored.shape)
+            if bands is None:
+                flushed = Modifier.__lookup(colored, table, None if keep else colored)
+            else:
+                flushed = Modifier.__banded(lambda band: Modifier.__lookup(band, table), colored, *bands)
+            Modifier.__recycle((pixels, colored), flushed, source)
+        oriented = Modifier.__orient(flushed, geometry)
+        Modifier.__recycle((flushed,), oriented, source)
+        flushed = oriented
+        if start is not None:
+            allocated = 0 if np.shares_memory(flushed, pixels) else flushed.nbytes
+            Modifier.__record('transform', '+'.join(merged), start, pixels.shape[0] * pixels.shape[1], allocated)
+        return flushed
+    def __writable(pixels: np.ndarray) -> bool:
+        # a read-only view of a writable array can be made writable, arrays over bytes cannot
+        if not pixels.flags.c_contiguous:
+            return False
+        try:
+            pixels.flags.writeable = True
+        except ValueError:
+            return False
+        return True
+    # pool of reusable pixel buffers that effects draw their outputs from, see use_pool
+    __buffers = None
+    @staticmethod
+    def use_pool(pool) -> None:
+        '''
+        Sets the BufferPool that effects and their intermediates take pixel buffers from, None turns pooling off
+        Buffers an effect has finished reading go back to the pool, as do those of modifiers passed to release,
+        so a run over images of one size soon stops allocating
+        '''
+        Modifier.__buffers = pool
+    def release(self) -> None:
+        '''
+        Hands this instance's pixel buffer back to the pool, see use_pool, for the next image to reuse
+        This instance must not be used afterwards
+        '''
+        if self.__source is not None:
+            Modifier.__recycle((self.__source,))
+        self.__source = self.__decoder = self.__image = None
+        self.__plan = ()
+    def __borrowed(pixels: np.ndarray, source: np.ndarray) -> bool:
+        # whether pixels are a view of a source buffer lent by the pool
+        buffers = Modifier.__buffers
+        return buffers is not None and np.may_share_memory(pixels, source) and buffers.lends(source)
+    def __take(shape: tuple, dtype = np.uint8) -> np.ndarray:
+        # a buffer from the pool, or None for OpenCV to allocate one
+        if Modifier.__buffers is None:
+            return None
+        return Modifier.__buffers.take(shape, dtype)
+    def __recycle(arrays: tuple, *live: np.ndarray) -> None:
+        # hands back each array that shares no memory with a live one, the pool ignores buffers it did not lend
+        if Modifier.__buffers is None:
+            return
+        memo = Modifier.__memo.get()
+        if memo is not None:
+            # intermediates shared by render_many stay until it ends
+            live += tuple(future.result() for _, future in list(memo.values()) if future.done() and future.exception() is None)
+        for array in arrays:
+            if not any(other is not None and np.may_share_memory(array, other) for other in live):
+                Modifier.__buffers.give(array)
+    # threads each image is split across in bands of rows, 1 runs each effect on the whole image
+    __threads = 1
+    __pool = None
+    __opencv_threads = None
+    # images smaller than this many pixels are not worth splitting
+    __PARALLEL_PIXELS = 2**20
+    @staticmethod
+    def set_threads(count: int = None) -> None:
+        '''
+        Sets the threads each image is split across, in bands of rows, defaults to the number of CPUs
+        Effects that can run in bands, as in tiled, then run on every band at once, with neighborhood effects
+        reading halo rows so the result matches the whole image
+        OpenCV is kept to one thread of its own meanwhile, so the two do not oversubscribe the CPUs,
+        and a count of 1 hands the threads back to OpenCV
+        '''
+        count = count or os.cpu_count() or 1
+        if Modifier.__opencv_threads is None:
+            Modifier.__opencv_threads = cv2.getNumThreads()
+        pool = Modifier.__pool
+        Modifier.__threads = count
+        Modifier.__pool = ThreadPoolExecutor(count, thread_name_prefix='modifier-band') if count > 1 else None
+        cv2.setNumThreads(1 if count > 1 else Modifier.__opencv_threads)
+        if pool is not None:
+            pool.shutdown(wait=False)
+    def __transform(effect: str, params: dict, pixels: np.ndarray) -> np.ndarray:
+        transform = Modifier.__effects[effect][0]
+        plan = Modifier.__resolve(((effect, params),), pixels.shape)
+        bands = Modifier.__bands(plan, pixels.shape)
+        params = plan[0][1]
+        if bands is None:
+            return transform(pixels, **params)
+        return Modifier.__banded(lambda band: transform(band, **params), pixels, *bands)
+    def __bands(plan: tuple, shape: tuple) -> tuple:
+        # (halo, rows) of the bands to split an image into, or None to run it whole
+        if Modifier.__pool is None or shape[0] * shape[1] < Modifier.__PARALLEL_PIXELS:
+            return None
+        try:
+            halo, align = Modifier.__halo(plan)
+        except ValueError:
+            return None
+        rows = -(-shape[0] // Modifier.__threads)
+        rows = -(-rows // align) * align
+        if rows >= shape[0]:
+            return None
+        return int(halo), rows
+    def __banded(function, pixels: np.ndarray, halo: int, rows: int) -> np.ndarray:
+        height = pixels.shape[0]
+        def run(top: int) -> tuple:
+            bottom = min(top + rows, height)
+            start, stop = max(0, top - halo), min(height, bottom + halo)
+            result = function(pixels[start:stop])
+            return top, result, result[top - start:bottom - start]
+        output = None
+        for future in [Modifier.__pool.submit(run, top) for top in range(0, height, rows)]:
+            top, result, band = future.result()
+            if output is None:
+                output = Modifier.__take((height,) + band.shape[1:], band.dtype)
+                if output is None:
+                    output = np.empty((height,) + band.shape[1:], band.dtype)
+            output[top:top + band.shape[0]] = band
+            Modifier.__recycle((result,), pixels)
+        return output
+    def __color(pixels: np.ndarray) -> np.ndarray:
+        if pixels.ndim == 2:
+            return cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB, dst=Modifier.__take(pixels.shape + (3,)))
+        return pixels
+    def __jpegtran(self, outputpath: str) -> bool:
+        if self.__file is None or not os.fspath(outputpath).lower().endswith(('.jpg', '.jpeg')):
+            return False
+        with open(self.__file, 'rb') as file:
+            if file.read(2) != b'\xff\xd8':
+                return False
+        geometry = Modifier.__IDENTITY
+        for effect, params in self.__plan:
+            steps = Modifier.__geometry(effect, params, self.__shape())
+            if steps is None:
+                return False
+            geometry = Modifier.__compose_all(steps, geometry)
+        jpegtran = shutil.which('jpegtran')
+        if jpegtran is None:
+            warnings.warn('jpegtran was not found, saving with a full decode and re-encode')
+            return False
+        command = [jpegtran, '-copy', 'all', '-perfect', *Modifier.__JPEGTRAN[geometry], '-outfile', outputpath, self.__file]
+        if subprocess.run(command, capture_output=True).returncode != 0:
+            # -perfect refuses images whose edges are not whole JPEG blocks
+            warnings.warn('jpegtran could not transform this image losslessly, saving with a full re-encode')
+            return False
+        return True
+    @staticmethod
+    def batch(source, effects: list, outputdir: str, workers: int = None, ordered: bool = True, inflight: int = None, format: str = None):
+        '''
+        Applies a chain of effects to every image in source, a glob pattern, a directory, or a list of paths
+        Effects is a list of effect names or (name, params) pairs, run as one lazy chain per image
+        Output goes to outputdir with each input's path under the glob's directory, the directory, or the paths' common one,
+        format can be passed in to change the extension, an input whose output path is already taken fails
+        Workers is the number of processes, defaults to the number of CPUs
+        Inflight caps how many images are queued or being processed at once, defaults to twice workers
+        Bool ordered can be set to False to yield results as they finish instead of in input order
+        Yields a BatchResult for each image, a failing image only sets that result's error
+        '''
+        effects = [Modifier.__effect_spec(effect) for effect in effects]
+        workers = workers or os.cpu_count() or 1
+        inflight = max(inflight or 2 * workers, 1)
+        os.makedirs(outputdir, exist_ok=True)
+        paths = Modifier.__sources(source)
+        root = Modifier.__root(source, paths)
+        paths = iter(paths)
+        taken = set()
+        # each worker gets an empty pool like this process's, if it has one
+        with ProcessPoolExecutor(max_workers=workers, initializer=Modifier.use_pool, initargs=(Modifier.__buffers,)) as pool:
+            pending = deque()
+            def submit() -> bool:
+                path = next(paths, None)
+                if path is None:
+                    return False
+                name = os.path.relpath(path, root)
+                if format is not None:
+                    name = os.path.splitext(name)[0] + '.' + format.lstrip('.')
+                outputpath = os.path.join(outputdir, name)
+                key = os.path.normcase(os.path.abspath(outputpath))
+                if key in taken:
+                    future = Future()
+                    future.set_result(BatchResult(path, None, 'ValueError: output %r is already taken by another input' % outputpath, 0.0, 0))
+                else:
+                    taken.add(key)
+                    future = pool.submit(_batch_file, path, effects, outputpath)
+                future.inputpath = path
+                pending.append(future)
+                return True
+            while len(pending) < inflight and submit():
+                pass
+            while pending:
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                    future = next(future for future in pending if future in done)
+                    pending.remove(future)
+                submit()
+                try:
+                    yield future.result()
+                except Exception as error:
+                    # the worker itself failed, for example a crashed process
+                    yield BatchResult(future.inputpath, None, '%s: %s' % (type(error).__name__, error), 0.0, 0)
+    @staticmethod
+    def tiled(inputpath: str, outputpath: str, effects: list, budget: int = 256 * 2**20) -> str:
+        '''
+        Applies a chain of effects to a very large image in bands of rows, so it is never held whole
+        Effects is a list of effect names or (name, params) pairs, as in batch
+        Budget is the working memory in bytes for one band, defaults to 256 MiB
+        Neighborhood effects read halo rows around each band, so band seams match the whole image
+        PPM/PGM and .npy inputs are read band by band, other formats are decoded once,
+        so memory is only bounded by budget for PPM/PGM and .npy inputs
+        PNG, TIFF, PPM/PGM and .npy outputs are written band by band, other formats, such as JPEG, are assembled first
+        Returns outputpath
+        '''
+        plan = tuple(Modifier.__effect_spec(effect) for effect in effects)
+        height, width, read = Modifier.__reader(inputpath)
+        plan = Modifier.__resolve(plan, (height, width))
+        halo, align = Modifier.__halo(plan)
+        rows = (budget // (width * Modifier.__BAND_BYTES) - 2 * halo) // align * align
+        if rows < align:
+            raise ValueError('a budget of %d bytes is too small for bands of this image' % budget)
+        writer = _BandWriter(outputpath, height)
+        try:
+            for top in range(0, height, rows):
+                bottom = min(top + rows, height)
+                start, stop = max(0, top - halo), min(height, bottom + halo)
+                band = Modifier.__render(read(start, stop), plan)
+                writer.write(band[top - start:bottom - start])
+        finally:
+            writer.close()
+        return outputpath
+    # working bytes per pixel of a band, enough for a float64 intermediate beside the input and output
+    __BAND_BYTES = 64
+    # rows each effect reads above and below a row, effects missing here cannot run in bands
+    __HALO = {
+        'negative': 0, 'primary': 0, 'tint': 0, 'recolor': 0, 'cool': 0, 'warm': 0, 'brightness': 0, 'curve': 0,
+        'grayscale': 0, 'sepia': 0, 'mirror_horizontal': 0, 'halftone': 0, 'dither': 0,
+        'blur': 0, # see __blur_halo
+        'sharpen': 1, 'emboss': 1,
+        'cartoon': 6, # 5x5 median then a 9x9 threshold block, the 9 wide bilateral filter fits inside, see __cartoon_halo
+        # detect_edges is missing, as Canny's hysteresis can follow an edge past any halo
+    }
+    def __resolve(plan: tuple, shape: tuple) -> tuple:
+        # an automatic blur method is picked once for the whole image, so every band uses the same one
+        return tuple(
+            (effect, {**params, 'method': Modifier.__blur_method(shape, params.get('radius', 17), params.get('sigma'), params.get('method', 'auto'))})
+            if effect == 'blur' else (effect, params) for effect, params in plan
+        )
+    def __halo(plan: tuple) -> tuple:
+        halo, align = 0, 1
+        for effect, params in plan:
+            if effect not in Modifier.__HALO:
+                raise ValueError('%s cannot run in bands' % effect)
+            halo += Modifier.__HALO[effect]
+            if effect == 'blur':
+                reach, factor = Modifier.__blur_halo(params)
+                halo += reach
+                align = np.lcm(align, factor)
+            if effect == 'cartoon' and params.get('quality', 'full') != 'full':
+                factor, diameter = Modifier.__CARTOON[params['quality']]
+                # the reduced filter and the linear upsampling can reach past the edge mask's rows
+                halo += max(0, (diameter // 2 + 2) * factor - Modifier.__HALO[effect])
+                align = np.lcm(align, factor)
+            if effect in ('halftone', 'dither'):
+                mode = params.get('mode', 'block')
+                if mode == 'diffusion':
+                    raise ValueError('%s cannot run in bands in diffusion mode' % effect)
+                # bands start on whole 2x2 cells or Bayer matrices
+                size = params.get('size', 2) if mode == 'ordered' else 2
+                align = np.lcm(align, size)
+        return -(-halo // align) * align, int(align)
+    def __blur_halo(params: dict) -> tuple:
+        # (rows read past each side of a band, rows bands must start on) for a blur
+        radius, sigma, method = params.get('radius', 17), params.get('sigma'), params['method']
+        if method == 'gaussian':
+            return radius, 1
+        sigma = Modifier.__sigma(radius, sigma)
+        if method == 'box':
+            return sum(width // 2 for width in Modifier.__boxes(sigma)), 1
+        factor = Modifier.__blur_factor(sigma)
+        small_sigma = max(.5, (sigma ** 2 - factor ** 2 / 4) ** .5 / factor)
+        # OpenCV's kernel for a sigma reaches 3 or 4 sigma, and linear upsampling one more row
+        return (int(np.ceil(4 * small_sigma)) + 2) * factor, factor
+    def __reader(inputpath: str) -> tuple:
+        extension = os.path.splitext(inputpath)[1].lower()
+        if extension == '.npy':
+            pixels = np.load(inputpath, mmap_mode='r')
+        elif extension in ('.ppm', '.pgm', '.pnm'):
+            pixels = Modifier.__netpbm(inputpath)
+        else:
+            image = Image.open(inputpath)
+            def read(top: int, bottom: int) -> np.ndarray:
+                return Modifier.__to_array(image.crop((0, top, image.width, bottom)).convert('RGB'))
+            return image.height, image.width, read
+        return pixels.shape[0], pixels.shape[1], lambda top, bottom: np.asarray(pixels[top:bottom])
+    def __netpbm(inputpath: str) -> np.ndarray:
+        # binary 8 bit P5 (gray) or P6 (RGB), mapped rather than read
+        with open(inputpath, 'rb') as file:
+            fields = []
+            while len(fields) < 4:
+                line = file.readline()
+                if not line:
+                    raise ValueError('%s is not a complete PPM/PGM file' % inputpath)
+                fields += line.split(b'#')[0].split()
+            offset = file.tell()
+        magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+        if magic not in (b'P5', b'P6') or maxval != 255:
+            raise ValueError('only 8 bit binary PPM/PGM files can be read in bands')
+        shape = (height, width) if magic == b'P5' else (height, width, 3)
+        return np.memmap(inputpath, dtype=np.uint8, mode='r', offset=offset, shape=shape)
+    def render_many(self, variants, outputdir: str = None, format: str = 'JPEG', workers: int = None, **options) -> dict:
+        '''
+        Renders many variants of this instance's image at once, decoding it a single time
+        Variants is a list of effect names or (name, params) pairs, named after their effect,
+        or a dict from a variant name to one of those or to a list of them, a chain run in order
+        Steps that chains start with in common are computed once, as are intermediates several variants need,
+        such as the luminance of halftone and the edge mask of cartoon, and independent branches run in parallel
+        Each variant is encoded as soon as it is ready, beside the others
+        Output goes to outputdir as name.jpg for each variant, or the extension of format, if outputdir is given
+        Workers is the number of threads, defaults to the number of CPUs
+        Encoder options such as quality can be passed in, see save
+        Returns a dict from each variant name to its encoded bytes, or to its output path if outputdir is given
+        '''
+        chains = Modifier.__variants(variants)
+        source = self.pixels
+        for name, effects in chains.items():
+            # recorded through the effect methods, which fill in the default params
+            chained = Modifier(pixels=source, lazy=True)
+            for effect, params in effects:
+                chained = getattr(chained, effect)(**params)
+            chains[name] = Modifier.__resolve(chained.__plan, source.shape)
+        tree = Modifier.__branches(chains)
+        if outputdir is not None:
+            os.makedirs(outputdir, exist_ok=True)
+        extension = 'jpg' if format.upper() == 'JPEG' else format.lower()
+        results = {}
+        def branch(node: tuple, pixels: np.ndarray) -> list:
+            steps, names, children = node
+            if steps:
+                pixels = Modifier.__render(pixels, steps)
+            # the branches below start before this one is encoded
+            futures = [executor.submit(contextvars.copy_context().run, branch, child, pixels) for child in children]
+            for name in names:
+                result = Modifier(pixels=pixels)
+                result.__options = Modifier.__effects[chains[name][-1][0]][1] if chains[name] else self.__options
+                if outputdir is None:
+                    results[name] = result.to_bytes(format, **options)
+                else:
+                    results[name] = os.path.join(outputdir, name + '.' + extension)
+                    result.save(results[name], format=format, **options)
+            return futures
+        token = Modifier.__memo.set({})
+        try:
+            with ThreadPoolExecutor(workers or os.cpu_count() or 1, thread_name_prefix='modifier-variant') as executor:
+                pending = [executor.submit(contextvars.copy_context().run, branch, tree, source)]
+                while pending:
+                    pending.extend(pending.pop().result())
+        finally:
+            Modifier.__memo.reset(token)
+        return {name: results[name] for name in chains}
+    def __variants(variants) -> dict:
+        # name: plan of each variant
+        if not isinstance(variants, dict):
+            named = {}
+            for effect in variants:
+                name = Modifier.__effect_spec(effect)[0]
+                if name in named:
+                    raise ValueError('effect %r is given twice, name the variants with a dict' % name)
+                named[name] = effect
+            variants = named
+        chains = {}
+        for name, effects in variants.items():
+            if isinstance(effects, str) or isinstance(effects, tuple) and len(effects) == 2 and isinstance(effects[1], dict):
+                effects = [effects]
+            chains[name] = tuple(Modifier.__effect_spec(effect) for effect in effects)
+        return chains
+    def __branches(chains: dict) -> tuple:
+        # the variants as a tree of (steps, names of the variants ending after them, child branches),
+        # split only where chains part ways, so each run of steps still renders as one plan
+        trie = ([], {})
+        for name, plan in chains.items():
+            node = trie
+            for effect, params in plan:
+                key = repr((effect, sorted(params.items())))
+                node = node[1].setdefault(key, ((effect, params), ([], {})))[1]
+            node[0].append(name)
+        def compress(steps: tuple, node: tuple) -> tuple:
+            names, children = node
+            while not names and len(children) == 1:
+                step, node = next(iter(children.values()))
+                steps += (step,)
+                names, children = node
+            return steps, names, [compress((step,), child) for step, child in children.values()]
+        return compress((), trie)
+    # intermediates shared by the variants of render_many, {(name, id of the input): (input, future of the result)}
+    __memo = contextvars.ContextVar('memo', default=None)
+    __memo_lock = threading.Lock()
+    def __shared(name: str, pixels: np.ndarray, compute) -> np.ndarray:
+        # compute(pixels) once for every variant of render_many reading the same read-only input, directly otherwise
+        memo = Modifier.__memo.get()
+        if memo is None or pixels.flags.writeable:
+            return compute(pixels)
+        key = (name, id(pixels))
+        with Modifier.__memo_lock:
+            entry = memo.get(key)
+            owner = entry is None
+            if owner:
+                entry = memo[key] = (pixels, Future())
+        if owner:
+            try:
+                value = compute(pixels)
+            except BaseException as error:
+                entry[1].set_exception(error)
+                raise
+            value.flags.writeable = False
+            entry[1].set_result(value)
+        return entry[1].result()
+    @staticmethod
+    def frames(inputpath: str, effects: list):
+        '''
+        Applies a chain of effects to each frame of an animated GIF, WebP or PNG, or of a video, reading one frame at a time
+        Effects is a list of effect names or (name, params) pairs, as in batch
+        Yields (pixels, duration) for each frame, its read-only RGB result and how long it shows in milliseconds
+        Lookup tables and other state of each effect are built for the first frame and reused for the rest
+        '''
+        plan = tuple(Modifier.__effect_spec(effect) for effect in effects)
+        resolved = None
+        for frame, duration in Modifier.__frames(inputpath):
+            if resolved is None:
+                resolved = Modifier.__resolve(plan, frame.shape)
+            pixels = Modifier.__render(frame.view(), resolved)
+            # the frame buffer is reused for the next frame
+            yield (pixels.copy() if np.may_share_memory(pixels, frame) else pixels), duration
+    @staticmethod
+    def stream(inputpath: str, outputpath: str, effects: list, fps: float = None) -> int:
+        '''
+        Applies a chain of effects to each frame of an animated image or a video, see frames,
+        and writes each one as it is made to outputpath, a .gif or a .mp4, .mov, .m4v, .avi or .mkv video
+        The frames are never all held at once
+        Fps can be passed in for a video output, defaults to the rate of the first frame
+        Returns the number of frames written
+        '''
+        writer = _FrameWriter(outputpath, fps)
+        try:
+            for pixels, duration in Modifier.frames(inputpath, effects):
+                writer.write(pixels, duration)
+        finally:
+            writer.close()
+        return writer.count
+    __ANIMATIONS = ('.gif', '.webp', '.png', '.apng')
+    def __frames(inputpath: str):
+        if os.path.splitext(inputpath)[1].lower() in Modifier.__ANIMATIONS:
+            with Image.open(inputpath) as image:
+                for frame in ImageSequence.Iterator(image):
+                    yield np.asarray(frame.convert('RGB')), frame.info.get('duration', 100)
+            return
+        capture = cv2.VideoCapture(inputpath)
+        if not capture.isOpened():
+            raise ValueError('cannot read the frames of %r' % inputpath)
+        duration = 1000 / (capture.get(cv2.CAP_PROP_FPS) or 25)
+        frame = rgb = None
+        try:
+            while True:
+                # both buffers are filled in place after the first frame
+                ok, frame = capture.read(frame)
+                if not ok:
+                    return
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, rgb)
+                yield rgb, duration
+        finally:
+            capture.release()
+    @staticmethod
+    def effects() -> list:
+        '''
+        Returns the names of every effect, as batch, tiled, frames and render_many take them
+        '''
+        return list(Modifier.__effects)
+    __ALIASES = {'invert': 'negative', 'greyscale': 'grayscale', 'gaussian_blur': 'blur'}
+    __EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+    def __effect_spec(effect) -> tuple:
+        name, params = (effect, {}) if isinstance(effect, str) else effect
+        name = Modifier.__ALIASES.get(name, name)
+        if name not in Modifier.__effects:
+            raise ValueError('unknown effect %r' % name)
+        return name, dict(params)
+    def __sources(source) -> list:
+        if not isinstance(source, str):
+            return list(source)
+        if os.path.isdir(source):
+            names = sorted(os.listdir(source))
+            return [os.path.join(source, name) for name in names if name.lower().endswith(Modifier.__EXTENSIONS)]
+        return sorted(glob.glob(source, recursive=True))
+    def __root(source, paths: list) -> str:
+        # the directory batch outputs are named relative to, so inputs in different subdirectories keep apart
+        if isinstance(source, str):
+            if os.path.isdir(source):
+                return source
+            root = os.path.dirname(source)
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            return root or os.curdir
+        if not paths:
+            return os.curdir
+        return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    @staticmethod
+    def register_curve(name: str, red, green = None, blue = None) -> None:
+        '''
+        Registers a tone curve that can then be applied by name with curve
+        Red, green, and blue are the 256 output values for each input value, green and blue default to red
+        '''
+        channels = [red, red if green is None else green, red if blue is None else blue]
+        channels = [np.clip(np.rint(np.asarray(channel, dtype=np.float64)), 0, 255) for channel in channels]
+        if any(channel.shape != (256,) for channel in channels):
+            raise ValueError('a curve needs 256 values for each channel')
+        table = np.stack(channels, axis=1).astype(np.uint8)
+        table.flags.writeable = False
+        Modifier.__curves[name] = table
+    def curve(self, name: str, outputpath: str = 'curve.jpg', show: bool = False):
+        '''
+        Creates a version of this instance's image with the tone curve registered as name
+        Output goes to filename outputpath, defaults to curve.jpg
+        Bool can be passed in if image should be shown upon finishing
+        Returns a modifier of the output image
+        '''
+        if name not in Modifier.__curves:
+            raise ValueError('no curve is registered as %r' % name)
+        return self.__apply('curve', outputpath, show, name=name)
+    def __curve(pixels: np.ndarray, name: str) -> np.ndarray:
+        return Modifier.__lookup(pixels, Modifier.__curves[name])
+    # per-channel point effects run as 256-entry tables of shape (256, 3)
+    # those without params are built once per process, the most recent ones with params are kept,
+    # as any number of params can be asked for
+    __POINT = ('negative', 'primary', 'tint', 'recolor', 'cool', 'warm', 'brightness')
+    __RECENT_TABLES = 64
+    __tables = {}
+    __recent = OrderedDict()
+    __tables_lock = threading.Lock()
+    __curves = {}
+    __RAMP = np.repeat(np.arange(256, dtype=np.uint8)[np.newaxis, :, np.newaxis], 3, axis=2)
+    def __table(effect: str, params: dict) -> np.ndarray:
+        if effect == 'curve':
+            return Modifier.__curves[params['name']]
+        if effect not in Modifier.__POINT:
+            return None
+        if not params:
+            tables, key = Modifier.__tables, effect
+        else:
+            tables, key = Modifier.__recent, (effect, tuple(sorted(params.items())))
+        with Modifier.__tables_lock:
+            table = tables.get(key)
+            if table is not None and params:
+                tables.move_to_end(key)
+        if table is None:
+            # the effect itself run over every input value gives its table exactly
+            table = Modifier.__effects[effect][0](Modifier.__RAMP, **params)[0]
+            table.flags.writeable = False
+            with Modifier.__tables_lock:
+                tables[key] = table
+                if len(tables) > Modifier.__RECENT_TABLES and params:
+                    tables.popitem(last=False)
+        return table
+    def __fuse(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        return np.take_along_axis(second, first.astype(np.intp), axis=0)
+    def __lookup(pixels: np.ndarray, table: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+        # dst may be pixels itself, a lookup reads each value before writing it
+        if dst is None:
+            dst = Modifier.__take(pixels.shape)
+        return cv2.LUT(pixels, np.ascontiguousarray(table[:, np.newaxis, :]), dst=dst)
     def negative(self, outputpath: str = 'negative.jpg', show: bool = False):
         '''
         Creates a negative version of this instance's image
@@ -31,79 +1143,49 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        negative = self.image.copy()
-        for i in range(self.image.width):
-            for j in range(self.image.height):
-                r, g, b = self.image.getpixel((i, j))
-                negated = (255-r, 255-g, 255-b)
-                negative.putpixel((i, j), negated)
-        negative.save(outputpath)
-        if show:
-            negative.show()
-        return Modifier(outputpath)
+        return self.__apply('negative', outputpath, show)
     invert = negative
-    def mirror_vertical(self, outputpath: str = 'mirrorvertical.jpg', show: bool = False):
+    def __negative(pixels: np.ndarray) -> np.ndarray:
+        return 255 - pixels
+    def __to_array(image: Image) -> np.ndarray:
+        pixels = np.asarray(image, dtype=np.uint8)
+        pixels.flags.writeable = False
+        return pixels
+    def __to_image(pixels: np.ndarray) -> Image:
+        return Image.fromarray(pixels)
+    def __bgr(pixels: np.ndarray) -> np.ndarray:
+        return pixels[:, :, ::-1]
+    def __matrix(pixels: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        # 3x3 color matrix, accumulated column by column so each channel sums in r, g, b order
+        pixels = pixels.astype(np.float64)
+        result = pixels[:, :, 0, np.newaxis] * matrix[:, 0]
+        result += pixels[:, :, 1, np.newaxis] * matrix[:, 1]
+        result += pixels[:, :, 2, np.newaxis] * matrix[:, 2]
+        return result
+    def __saturate(pixels: np.ndarray) -> np.ndarray:
+        return np.minimum(pixels, 255)
+    def mirror_vertical(self, outputpath: str = 'mirrorvertical.jpg', show: bool = False, lossless: bool = False):
         '''
         Creates a mirrored vertical version of this instance's image
         Output goes to filename outputpath, defaults to mirrorvertical.jpg
         Bool can be passed in if image should be shown upon finishing
+        Bool lossless can be passed in to flip a JPEG without re-encoding it, see save
         Returns a modifier of the output image
         '''
-        mirror = self.image.copy()
-        pixels = []
-        for i in range(self.image.width):
-            pixelrow = []
-            for j in range(self.image.height):
-                r, g, b = self.image.getpixel((i, j))
-                pixelrow.append((r, g, b))
-            pixels.append(pixelrow)
-        for pixelrow in pixels:
-            mid = len(pixelrow) // 2
-            left = 0; right = len(pixelrow) - 1
-            for i in range(mid):
-                copy = pixelrow[left]
-                pixelrow[left] = pixelrow[right]
-                pixelrow[right] = copy
-                left += 1; right -= 1
-        for i in range(mirror.width):
-            for j in range(mirror.height):
-                colors = pixels[i][j]
-                mirror.putpixel((i, j), (colors[0], colors[1], colors[2]))
-        mirror.save(outputpath)
-        if show:
-            mirror.show()
-        return Modifier(outputpath)
-    def mirror_horizontal(self, outputpath: str = 'mirrorhorizontal.jpg', show: bool = False):
+        return self.__apply('mirror_vertical', outputpath, show, lossless)
+    def __mirror_vertical(pixels: np.ndarray) -> np.ndarray:
+        return pixels[::-1]
+    def mirror_horizontal(self, outputpath: str = 'mirrorhorizontal.jpg', show: bool = False, lossless: bool = False):
         '''
         Creates a mirrored horizontal version of this instance's image
         Output goes to filename outputpath, defaults to mirrorhorizontal.jpg
         Bool can be passed in if image should be shown upon finishing
+        Bool lossless can be passed in to flip a JPEG without re-encoding it, see save
         Returns a modifier of the output image
         '''
-        mirror = self.image.copy()
-        pixels = []
-        for i in range(self.image.height):
-            pixelrow = []
-            for j in range(self.image.width):
-                r, g, b = self.image.getpixel((j, i))
-                pixelrow.append((r, g, b))
-            pixels.append(pixelrow)
-        for pixelrow in pixels:
-            mid = len(pixelrow) // 2
-            left = 0; right = len(pixelrow) - 1
-            for i in range(mid):
-                copy = pixelrow[left]
-                pixelrow[left] = pixelrow[right]
-                pixelrow[right] = copy
-                left += 1; right -= 1
-        for i in range(mirror.height):
-            for j in range(mirror.width):
-                colors = pixels[i][j]
-                mirror.putpixel((j, i), (colors[0], colors[1], colors[2]))
-        mirror.save(outputpath)
-        if show:
-            mirror.show()
-        return Modifier(outputpath)
+        return self.__apply('mirror_horizontal', outputpath, show, lossless)
+    def __mirror_horizontal(pixels: np.ndarray) -> np.ndarray:
+        return pixels[:, ::-1]
     def grayscale(self, outputpath: str = 'grayscale.jpg', show: bool = False):
         '''
         Creates a grayscale version of this instance's image
@@ -112,18 +1194,11 @@ class Modifier:
         Returns a modifier of the output image
         Alias to greyscale
         '''
-        grayscale = self.image.copy()
-        for i in range(self.image.width):
-            for j in range(self.image.height):
-                r, g, b = self.image.getpixel((i, j))
-                gray = (r + g + b) // 3
-                grayed = (gray, gray, gray)
-                grayscale.putpixel((i, j), grayed)
-        grayscale.save(outputpath)
-        if show:
-            grayscale.show()
-        return Modifier(outputpath)
+        return self.__apply('grayscale', outputpath, show)
     greyscale = grayscale #alias for grayscale using grey spelling
+    def __grayscale(pixels: np.ndarray) -> np.ndarray:
+        gray = (pixels.sum(axis=2, dtype=np.uint16) // 3).astype(np.uint8)
+        return np.repeat(gray[:, :, np.newaxis], 3, axis=2)
     def sepia(self, outputpath: str = 'sepia.jpg', show: bool = False):
         '''
         Creates a sepia version of this instance's image
@@ -131,21 +1206,10 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        sepia = self.image.copy()
-        for i in range(self.image.width):
-            for j in range(self.image.height):
-                r, g, b = self.image.getpixel((i, j))
-                rn = (r*.393) + (g*.769) + (b*.189)
-                gn = (r*.349) + (g*.686) + (b*.168)
-                bn = (r*.272) + (g*.534) + (b*.131)
-                rn = 255 if rn > 255 else int(rn)
-                gn = 255 if gn > 255 else int(gn)
-                bn = 255 if bn > 255 else int(bn)
-                sepia.putpixel((i, j), (rn, gn, bn))
-        sepia.save(outputpath)
-        if show:
-            sepia.show()
-        return Modifier(outputpath)
+        return self.__apply('sepia', outputpath, show)
+    def __sepia(pixels: np.ndarray) -> np.ndarray:
+        # float results are truncated toward zero, matching int() on each channel
+        return Modifier.__saturate(Modifier.__matrix(pixels, Modifier.__SEPIA)).astype(np.uint8)
     def average(self, outputpath: str = 'average.jpg', show: bool = False):
         '''
         Creates a new image of one color, being the average of all colors, of this instance's image
@@ -153,77 +1217,68 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        average = self.image.copy()
-        rtotal = 0; gtotal = 0; btotal = 0; pixels = 0
-        for i in range(average.width):
-            for j in range(average.height):
-                r, g, b = average.getpixel((i, j))
-                rtotal += r; gtotal += g; btotal += b; pixels += 1
-        ravg = rtotal//pixels; gavg = gtotal//pixels; bavg = btotal//pixels
-        for i in range(average.width):
-            for j in range(average.height):
-                average.putpixel((i, j), (ravg, gavg, bavg))
-        average.save(outputpath)
-        del rtotal, gtotal, btotal, pixels, ravg, gavg, bavg #clear memory
-        if show:
-            average.show()
-        return Modifier(outputpath)
-    def halftone(self, outputpath: str = 'halftone.jpg', show: bool = False):
+        return self.__apply('average', outputpath, show)
+    def __average(pixels: np.ndarray) -> np.ndarray:
+        histogram = Modifier.__histogram(pixels)
+        average = histogram @ np.arange(256) // histogram[0].sum()
+        return np.full(pixels.shape, average.astype(np.uint8), dtype=np.uint8)
+    def halftone(self, outputpath: str = 'halftone.jpg', show: bool = False, mode: str = 'block', size: int = 2):
         '''
         Creates a halftone version of this instance's image
         Output goes to filename outputpath, defaults to halftone.jpg
         Bool can be passed in if image should be shown upon finishing
+        Mode can be passed in as block (2x2 cells), ordered (Bayer matrix) or diffusion (Floyd-Steinberg), defaults to block
+        Size can be passed in for the width of the ordered Bayer matrix, a power of two, defaults to 2
         Returns a modifier of the output image
         '''
-        halftone = self.image.copy()
-        for i in range(0, halftone.width, 2):
-            if i >= halftone.width or i+1 >= halftone.width:
-                break
-            for j in range(0, halftone.height, 2):
-                if j >= halftone.width or j+1 >= halftone.width:
-                    break
-                r1, g1, b1 = halftone.getpixel((i, j))
-                r2, g2, b2 = halftone.getpixel((i, j+1))
-                r3, g3, b3 = halftone.getpixel((i+1, j))
-                r4, g4, b4 = halftone.getpixel((i+1, j+1))
-                gray1 = (r1*0.299) + (g1*0.587) + (b1*0.114)
-                gray2 = (r2*0.299) + (g2*0.587) + (b2*0.114)
-                gray3 = (r3*0.299) + (g3*0.587) + (b3*0.114)
-                gray4 = (r4*0.299) + (g4*0.587) + (b4*0.114)
-                del r1, r2, r3, r4, g1, g2, g3, g4, b1, b2, b3, b4 #clear memory
-                saturation = (gray1 + gray2 + gray3 + gray4) / 4
-                Modifier.__put_pixel(halftone, i, j, saturation) # necessary method due to cognitive complexity
-        halftone.save(outputpath)
-        if show:
-            halftone.show()
-        return Modifier(outputpath)
-    def __put_pixel(halftone: Image, i: int, j: int, saturation: float) -> None:
-        WHITE = (255, 255, 255); BLACK = (0, 0, 0)
-        if saturation > 223:
-            halftone.putpixel((i, j), WHITE)
-            halftone.putpixel((i, j+1), WHITE)
-            halftone.putpixel((i+1, j), WHITE)
-            halftone.putpixel((i+1, j+1), WHITE)
-        elif saturation > 159:
-            halftone.putpixel((i, j), WHITE)
-            halftone.putpixel((i, j+1), BLACK)
-            halftone.putpixel((i+1, j), WHITE)
-            halftone.putpixel((i+1, j+1), WHITE)
-        elif saturation > 95:
-            halftone.putpixel((i, j), WHITE)
-            halftone.putpixel((i, j+1), BLACK)
-            halftone.putpixel((i+1, j), BLACK)
-            halftone.putpixel((i+1, j+1), WHITE)
-        elif saturation > 32:
-            halftone.putpixel((i, j), BLACK)
-            halftone.putpixel((i, j+1), WHITE)
-            halftone.putpixel((i+1, j), BLACK)
-            halftone.putpixel((i+1, j+1), BLACK)
-        else:
-            halftone.putpixel((i, j), BLACK)
-            halftone.putpixel((i, j+1), BLACK)
-            halftone.putpixel((i+1, j), BLACK)
-            halftone.putpixel((i+1, j+1), BLACK)
+        return self.__apply('halftone', outputpath, show, mode=mode, size=size)
+    def __halftone(pixels: np.ndarray, mode: str = 'block', size: int = 2) -> np.ndarray:
+        if mode == 'diffusion':
+            # Pillow's C Floyd-Steinberg on luminance
+            halftone = Modifier.__diffuse(Modifier.__to_image(pixels).convert('L'))
+            return np.repeat(halftone[:, :, np.newaxis], 3, axis=2)
+        gray = Modifier.__shared('luminance', pixels, Modifier.__luminance)
+        if mode == 'ordered':
+            halftone = np.where(gray > Modifier.__threshold(size, gray.shape), 255, 0).astype(np.uint8)
+            return np.repeat(halftone[:, :, np.newaxis], 3, axis=2)
+        Modifier.__check_mode(mode)
+        cells = Modifier.__cells(gray)
+        saturation = (cells[:, 0, :, 0] + cells[:, 1, :, 0] + cells[:, 0, :, 1] + cells[:, 1, :, 1]) / 4
+        tones = Modifier.__tones(saturation)
+        halftone = pixels.copy()
+        Modifier.__cells(halftone)[:] = tones.transpose(0, 2, 1, 3)[:, :, :, :, np.newaxis]
+        return halftone
+    def __luminance(pixels: np.ndarray) -> np.ndarray:
+        channels = pixels.astype(np.float64)
+        return (channels[:, :, 0]*0.299) + (channels[:, :, 1]*0.587) + (channels[:, :, 2]*0.114)
+    # 2x2 cell patterns for each tone level, indexed [level, row, column]
+    __CELLS = np.array([
+        [[0, 0], [0, 0]],
+        [[0, 0], [255, 0]],
+        [[255, 0], [0, 255]],
+        [[255, 255], [0, 255]],
+        [[255, 255], [255, 255]],
+    ], dtype=np.uint8)
+    __LEVELS = [32, 95, 159, 223]
+    def __cells(pixels: np.ndarray) -> np.ndarray:
+        # view of the whole 2x2 cells as (cell row, row, cell column, column, ...), a trailing odd row or column is left alone
+        height, width = pixels.shape[0] // 2, pixels.shape[1] // 2
+        return pixels[:height*2, :width*2].reshape(height, 2, width, 2, *pixels.shape[2:])
+    def __tones(saturation: np.ndarray) -> np.ndarray:
+        return Modifier.__CELLS[np.digitize(saturation, Modifier.__LEVELS, right=True)]
+    def __threshold(size: int, shape: tuple) -> np.ndarray:
+        if size < 2 or size & (size - 1):
+            raise ValueError('size must be a power of two, got %r' % size)
+        bayer = np.zeros((1, 1), dtype=np.int64)
+        while bayer.shape[0] < size:
+            bayer = np.block([[4*bayer, 4*bayer + 2], [4*bayer + 3, 4*bayer + 1]])
+        threshold = (bayer + .5) * 255 / (size * size)
+        return np.tile(threshold, (-(-shape[0] // size), -(-shape[1] // size)))[:shape[0], :shape[1]]
+    def __diffuse(channel: Image) -> np.ndarray:
+        return np.asarray(channel.convert('1', dither=Image.Dither.FLOYDSTEINBERG), dtype=np.uint8) * np.uint8(255)
+    def __check_mode(mode: str) -> None:
+        if mode not in ('block', 'ordered', 'diffusion'):
+            raise ValueError('mode must be block, ordered or diffusion, got %r' % mode)
     def primary(self, outputpath: str = 'primary.jpg', show: bool = False):
         '''
         Creates a primary version of this instance's image
@@ -231,70 +1286,33 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        primary = self.image.copy()
-        for i in range(primary.width):
-            for j in range(primary.height):
-                r, g, b = primary.getpixel((i, j))
-                r = 255 if r > 127 else 0
-                g = 255 if g > 127 else 0
-                b = 255 if b > 127 else 0
-                primary.putpixel((i, j), (r, g, b))
-        primary.save(outputpath)
-        if show:
-            primary.show()
-        return Modifier(outputpath)
-    def dither(self, outputpath: str = 'dither.jpg', show: bool = False):
+        return self.__apply('primary', outputpath, show)
+    def __primary(pixels: np.ndarray) -> np.ndarray:
+        return np.where(pixels > 127, 255, 0).astype(np.uint8)
+    def dither(self, outputpath: str = 'dither.jpg', show: bool = False, mode: str = 'block', size: int = 2):
         '''
         Creates a dither version of this instance's image
         Output goes to filename outputpath, defaults to dither.jpg
         Bool can be passed in if image should be shown upon finishing
+        Mode can be passed in as block (2x2 cells), ordered (Bayer matrix) or diffusion (Floyd-Steinberg), defaults to block
+        Size can be passed in for the width of the ordered Bayer matrix, a power of two, defaults to 2
         Returns a modifier of the output image
         '''
-        dither = self.image.copy()
-        for i in range(0, dither.width, 2):
-            if i >= dither.width or i+1 >= dither.width:
-                break
-            for j in range(0, dither.height, 2):
-                if j >= dither.width or j+1 >= dither.width:
-                    break
-                r1, g1, b1 = dither.getpixel((i, j))
-                r2, g2, b2 = dither.getpixel((i, j+1))
-                r3, g3, b3 = dither.getpixel((i+1, j))
-                r4, g4, b4 = dither.getpixel((i+1, j+1))
-                red = (r1 + r2 + r3 + r4) / 4
-                green = (g1 + g2 + g3 + g4) / 4
-                blue = (b1 + b2 + b3 + b4) / 4
-                r = [0, 0, 0, 0]; g = [0, 0, 0, 0]; b = [0, 0, 0, 0]
-                for x in range(0, 4):
-                    r[x] = Modifier.__dither_saturation(red, x) # necessary method due to cognitive complexity
-                    g[x] = Modifier.__dither_saturation(green, x)
-                    b[x] = Modifier.__dither_saturation(blue, x)
-                dither.putpixel((i, j), (r[0], g[0], b[0]))
-                dither.putpixel((i, j+1), (r[1], g[1], b[1]))
-                dither.putpixel((i+1, j), (r[2], g[2], b[2]))
-                dither.putpixel((i+1, j+1), (r[3], g[3], b[3]))
-                del r1, r2, r3, r4, g1, g2, g3, g4, b1, b2, b3, b4, red, green, blue, r, g, b # clear memory
-        dither.save(outputpath)
-        if show:
-            dither.show()
-        return Modifier(outputpath)
-    def __dither_saturation(color: float, index: int) -> int:
-        if color > 223:
-            return 255
-        elif color > 159:
-            if index != 1:
-                return 255
-            return 0
-        elif color > 95:
-            if index == 0 or index == 3:
-                return 255
-            return 0
-        elif color > 32:
-            if index == 1:
-                return 255
-            return 0
-        else:
-            return 0
+        return self.__apply('dither', outputpath, show, mode=mode, size=size)
+    def __dither(pixels: np.ndarray, mode: str = 'block', size: int = 2) -> np.ndarray:
+        if mode == 'diffusion':
+            channels = Modifier.__to_image(pixels).split()
+            return np.stack([Modifier.__diffuse(channel) for channel in channels], axis=2)
+        if mode == 'ordered':
+            threshold = Modifier.__threshold(size, pixels.shape)
+            return np.where(pixels > threshold[:, :, np.newaxis], 255, 0).astype(np.uint8)
+        Modifier.__check_mode(mode)
+        cells = Modifier.__cells(pixels).astype(np.int32)
+        color = (cells[:, 0, :, 0] + cells[:, 1, :, 0] + cells[:, 0, :, 1] + cells[:, 1, :, 1]) / 4
+        tones = Modifier.__tones(color)
+        dither = pixels.copy()
+        Modifier.__cells(dither)[:] = tones.transpose(0, 3, 1, 4, 2)
+        return dither
     def tint(self, outputpath: str = 'tint.jpg', show: bool = False):
         '''
         Creates a tinted version of this instance's image
@@ -302,18 +1320,10 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        tint = self.image.copy()
-        for i in range(tint.width):
-            for j in range(tint.height):
-                r, g, b = tint.getpixel((i, j))
-                r = r + (.25 * (255-r))
-                g = g + (.25 * (255-g))
-                b = b + (.25 * (255-b))
-                tint.putpixel((i, j), (int(r), int(g), int(b)))
-        tint.save(outputpath)
-        if show:
-            tint.show()
-        return Modifier(outputpath)
+        return self.__apply('tint', outputpath, show)
+    def __tint(pixels: np.ndarray) -> np.ndarray:
+        pixels = pixels.astype(np.float64)
+        return (pixels + (.25 * (255-pixels))).astype(np.uint8)
     def recolor(self, outputpath: str = 'recolor.jpg', show: bool = False, dr: int = 100, dg: int = 100, db: int = 100):
         '''
         Creates a recolored version of this instance's image
@@ -322,92 +1332,93 @@ class Modifier:
         R, G, and B values can be passed in for recolor, all default to 100
         Returns a modifier of the output image
         '''
-        recolor = self.image.copy()
-        for i in range(recolor.width):
-            for j in range(recolor.height):
-                r, g, b = recolor.getpixel((i, j))
-                r += dr; g += dg; b += db
-                r, g, b = Modifier.__adjust_colors(r, g, b) # Method needed due to cognitive complexity
-                recolor.putpixel((i, j), (r, g, b))
-        recolor.save(outputpath)
-        if show:
-            recolor.show()
-        return Modifier(outputpath)
-    def __adjust_colors(r: int, g: int, b: int):
-        r = 255 if r > 255 else r
-        r = 0 if r < 0 else r
-        g = 255 if g > 255 else g 
-        g = 0 if g < 0 else g
-        b = 255 if b > 255 else b
-        b = 0 if b < 0 else b
-        return r, g, b
-    def rotate(self, outputpath: str = 'rotate.jpg', show: bool = False, degree: int = 90):
+        return self.__apply('recolor', outputpath, show, dr=dr, dg=dg, db=db)
+    def __recolor(pixels: np.ndarray, dr: int, dg: int, db: int) -> np.ndarray:
+        pixels = pixels.astype(np.int32) + np.array([dr, dg, db], dtype=np.int32)
+        return Modifier.__adjust_colors(pixels).astype(np.uint8)
+    def __adjust_colors(pixels: np.ndarray) -> np.ndarray:
+        return np.clip(pixels, 0, 255)
+    def rotate(self, outputpath: str = 'rotate.jpg', show: bool = False, degree: int = 90, expand: bool = False, lossless: bool = False):
         '''
         Creates a rotated version of this instance's image
         Output goes to filename outputpath, defaults to rotate.jpg
         Bool can be passed in if image should be shown upon finishing
         Degree value can be passed in for rotation degree from 0˚ on the x-axis, defaults to 90˚
+        Bool expand can be passed in to enlarge the output to hold the whole rotated image, defaults to False
+        Bool lossless can be passed in to rotate a JPEG by a right angle without re-encoding it, see save
         Returns a modifier of the output image
         '''
-        rotate = self.image.copy()
-        rotate = rotate.rotate(degree)
-        rotate.save(outputpath)
-        if show:
-            rotate.show()
-        return Modifier(outputpath)
-    def mirror_diagonal(self, outputpath: str = 'mirrordiagonal.jpg', show: bool = False):
+        return self.__apply('rotate', outputpath, show, lossless, degree=degree, expand=expand)
+    def __rotate(pixels: np.ndarray, degree: int, expand: bool = False) -> np.ndarray:
+        if degree % 90 != 0:
+            return Modifier.__to_array(Modifier.__to_image(pixels).rotate(degree, expand=expand))
+        rotated = Modifier.__orient(pixels, Modifier.__compose_all(Modifier.__ROTATIONS[int(degree // 90) % 4]))
+        if expand or rotated.shape == pixels.shape:
+            return rotated
+        return Modifier.__center(rotated, pixels.shape, int(degree // 90) % 4)
+    def __center(rotated: np.ndarray, shape: tuple, turns: int) -> np.ndarray:
+        # a quarter turn kept on the original canvas, cropped and padded with black the way PIL centres it
+        height, width = shape[:2]
+        difference = height - width
+        top = -(-difference // 2) if turns == 1 else difference // 2
+        left = -top
+        canvas = np.zeros(shape, dtype=rotated.dtype)
+        y, x = max(0, -top), max(0, -left)
+        dy, dx = max(0, top), max(0, left)
+        rows = min(rotated.shape[0] - y, height - dy); columns = min(rotated.shape[1] - x, width - dx)
+        canvas[dy:dy+rows, dx:dx+columns] = rotated[y:y+rows, x:x+columns]
+        return canvas
+    # counterclockwise quarter turns as geometry steps
+    __ROTATIONS = ((), ('transpose', 'rows'), ('rows', 'columns'), ('transpose', 'columns'))
+    def __geometry(effect: str, params: dict, shape: tuple) -> tuple:
+        if effect == 'mirror_vertical':
+            return ('rows',)
+        if effect == 'mirror_horizontal':
+            return ('columns',)
+        if effect == 'mirror_diagonal':
+            return ('rows', 'columns')
+        if effect == 'rotate' and params['degree'] % 90 == 0:
+            turns = int(params['degree'] // 90) % 4
+            if params['expand'] or turns % 2 == 0 or shape[0] == shape[1]:
+                return Modifier.__ROTATIONS[turns]
+        return None
+    def __compose(geometry: tuple, step: str) -> tuple:
+        transpose, rows, columns = geometry
+        if step == 'transpose':
+            return (not transpose, columns, rows)
+        if step == 'rows':
+            return (transpose, not rows, columns)
+        return (transpose, rows, not columns)
+    def __compose_all(steps: tuple, geometry: tuple = (False, False, False)) -> tuple:
+        for step in steps:
+            geometry = Modifier.__compose(geometry, step)
+        return geometry
+    def __orient(pixels: np.ndarray, geometry: tuple) -> np.ndarray:
+        transpose, rows, columns = geometry
+        if transpose:
+            # the one real copy, later passes would otherwise stride across rows
+            transposed = Modifier.__take(pixels.shape[1::-1] + pixels.shape[2:], pixels.dtype)
+            if transposed is None:
+                pixels = np.ascontiguousarray(pixels.swapaxes(0, 1))
+            else:
+                np.copyto(transposed, pixels.swapaxes(0, 1))
+                pixels = transposed
+        if rows:
+            pixels = pixels[::-1]
+        if columns:
+            pixels = pixels[:, ::-1]
+        return pixels
+    def mirror_diagonal(self, outputpath: str = 'mirrordiagonal.jpg', show: bool = False, lossless: bool = False):
         '''
         Creates a mirrored diagonal version of this instance's image
         Output goes to filename outputpath, defaults to mirrordiagonal.jpg
         Bool can be passed in if image should be shown upon finishing
+        Bool lossless can be passed in to flip a JPEG without re-encoding it, see save
         Returns a modifier of the output image
         '''
-        mirror = self.image.copy()
-        pixels = []
-        for i in range(self.image.height):
-            pixelrow = []
-            for j in range(self.image.width):
-                r, g, b = self.image.getpixel((j, i))
-                pixelrow.append((r, g, b))
-            pixels.append(pixelrow)
-        for pixelrow in pixels:
-            mid = len(pixelrow) // 2
-            left = 0; right = len(pixelrow) - 1
-            for i in range(mid):
-                copy = pixelrow[left]
-                pixelrow[left] = pixelrow[right]
-                pixelrow[right] = copy
-                left += 1; right -= 1
-        for i in range(mirror.height):
-            for j in range(mirror.width):
-                colors = pixels[i][j]
-                mirror.putpixel((j, i), (colors[0], colors[1], colors[2]))
-        mirror = Modifier.__secondary_mirror(mirror) #method needed due to cognitive complexity
-        mirror.save(outputpath)
-        if show:
-            mirror.show()
-        return Modifier(outputpath)
-    def __secondary_mirror(mirror: Image) -> Image:
-        pixels = []
-        for i in range(mirror.width):
-            pixelrow = []
-            for j in range(mirror.height):
-                r, g, b = mirror.getpixel((i, j))
-                pixelrow.append((r, g, b))
-            pixels.append(pixelrow)
-        for pixelrow in pixels:
-            mid = len(pixelrow) // 2
-            left = 0; right = len(pixelrow) - 1
-            for i in range(mid):
-                copy = pixelrow[left]
-                pixelrow[left] = pixelrow[right]
-                pixelrow[right] = copy
-                left += 1; right -= 1
-        for i in range(mirror.width):
-            for j in range(mirror.height):
-                colors = pixels[i][j]
-                mirror.putpixel((i, j), (colors[0], colors[1], colors[2]))
-        return mirror
+        return self.__apply('mirror_diagonal', outputpath, show, lossless)
+    def __mirror_diagonal(pixels: np.ndarray) -> np.ndarray:
+        return pixels[::-1, ::-1]
     def detect_edges(self, outputpath: str = 'detectedges.jpg', show: bool = False):
         '''
         Creates an edge detected version of this instance's image
@@ -415,51 +1426,178 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
-        edges = cv2.Canny(copy, 100, 200)
-        cv2.imwrite(outputpath, edges)
-        if show:
-            cv2.imshow(outputpath, edges)
-        return Modifier(outputpath)
-    def deepfry(self, outputpath: str = 'deepfry.jpg', show: bool = False):
+        return self.__apply('detect_edges', outputpath, show)
+    def __detect_edges(pixels: np.ndarray) -> np.ndarray:
+        # Canny picks the strongest channel per pixel and breaks ties by channel order
+        return cv2.Canny(Modifier.__bgr(pixels), 100, 200, edges=Modifier.__take(pixels.shape[:2]))
+    def deepfry(self, outputpath: str = 'deepfry.jpg', show: bool = False, strength: float = 1, crunch: int = None):
         '''
         Creates an deepfried version of this instance's image
         Output goes to filename outputpath, defaults to deepfry.jpg
         Bool can be passed in if image should be shown upon finishing
+        Strength can be passed in for how much detail is lost by shrinking the image first, 0 keeps it all, defaults to 1
+        Crunch can be passed in as a JPEG quality from 1 to 95 to compress the result at, for its blocky artifacts, defaults to None for none
         Returns a modifier of the output image
         '''
-        deepfry = self.image.copy()
-        width, height = deepfry.width, deepfry.height
-        deepfry = deepfry.resize((int(width ** .75), int(height ** .75)), resample=Image.LANCZOS)
-        deepfry = deepfry.resize((int(width ** .88), int(height ** .88)), resample=Image.BILINEAR)
-        deepfry = deepfry.resize((int(width ** .9), int(height ** .9)), resample=Image.BICUBIC)
-        deepfry = deepfry.resize((width, height), resample=Image.BICUBIC)
-        deepfry = ImageOps.posterize(deepfry, 4)
-        r = deepfry.split()[0]
-        r = ImageEnhance.Contrast(r).enhance(2.0)
-        r = ImageEnhance.Brightness(r).enhance(1.5)
-        RED = ((254, 0, 2), (255, 255, 15))
-        r = ImageOps.colorize(r, RED[0], RED[1])
-        deepfry = Image.blend(deepfry, r, 0.75)
-        deepfry = ImageEnhance.Sharpness(deepfry).enhance(100.0)
-        deepfry.save(outputpath)
-        if show:
-            deepfry.show()
-        return Modifier(outputpath)
-    def blur(self, outputpath: str = 'blur.jpg', show: bool = False):
+        return self.__apply('deepfry', outputpath, show, strength=strength, crunch=crunch)
+    # the colors the posterized red channel is mapped between, from a deep red to yellow
+    __FRY_RED = ((254, 0, 2), (255, 255, 15))
+    __SMOOTH = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+    def __deepfry(pixels: np.ndarray, strength: float = 1, crunch: int = None) -> np.ndarray:
+        if strength < 0:
+            raise ValueError('strength must be at least 0, got %r' % strength)
+        if crunch is not None and not 1 <= crunch <= 95:
+            raise ValueError('crunch must be from 1 to 95, got %r' % crunch)
+        height, width = pixels.shape[:2]
+        start = Modifier.__clock()
+        # one reduction and one enlargement, rather than climbing back through two sizes in between
+        exponent = 1 - .25 * strength
+        small = (max(1, int(width ** exponent)), max(1, int(height ** exponent)))
+        fried = pixels
+        if small != (width, height):
+            # Pillow reduces by whole blocks before its Lanczos filter, and OpenCV's bicubic enlarges many times faster
+            reduced = np.asarray(Modifier.__to_image(pixels).resize(small, resample=Image.LANCZOS, reducing_gap=2.0))
+            fried = cv2.resize(reduced, (width, height), dst=Modifier.__take(pixels.shape), interpolation=cv2.INTER_CUBIC)
+        if start is not None:
+            Modifier.__record('resize', 'deepfry', start, width * height, fried.nbytes)
+            start = Modifier.__clock()
+        # the resize needs the whole image, the color lookup and the sharpening can run in bands with set_threads
+        bands = Modifier.__bands((), fried.shape)
+        table = Modifier.__fry_table(fried)
+        if bands is None:
+            colored = Modifier.__fry_color(fried, table)
+        else:
+            colored = Modifier.__banded(lambda band: Modifier.__fry_color(band, table), fried, *bands)
+        if fried is not pixels:
+            Modifier.__recycle((fried,), colored)
+        if start is not None:
+            Modifier.__record('color', 'deepfry', start, width * height, colored.nbytes)
+            start = Modifier.__clock()
+        if bands is None:
+            fried = Modifier.__fry_sharpen(colored)
+        else:
+            # the SMOOTH filter reads one row past each side of a band
+            fried = Modifier.__banded(Modifier.__fry_sharpen, colored, 1, bands[1])
+        Modifier.__recycle((colored,), fried)
+        if start is not None:
+            Modifier.__record('filter', 'deepfry', start, width * height, fried.nbytes)
+        if crunch is None:
+            return fried
+        start = Modifier.__clock()
+        buffer = io.BytesIO()
+        Modifier.__to_image(fried).save(buffer, format='JPEG', quality=crunch)
+        Modifier.__recycle((fried,))
+        crunched = Modifier.__to_array(Image.open(buffer).convert('RGB'))
+        if start is not None:
+            Modifier.__record('crunch', 'deepfry', start, width * height, buffer.tell())
+        return crunched
+    def __fry_color(pixels: np.ndarray, table: np.ndarray) -> np.ndarray:
+        # posterizing, the contrast, brightness and colors of the red channel, and the blend over the image
+        # depend only on the top four bits of red and of each channel, so they are one lookup by both
+        planes = cv2.split(pixels)
+        high = planes[0] & 0xF0
+        index = cv2.merge([(plane >> 4) | high for plane in planes], dst=Modifier.__take(pixels.shape))
+        return cv2.LUT(index, table, dst=index)
+    def __fry_sharpen(colored: np.ndarray) -> np.ndarray:
+        # Pillow's Sharpness(100) pushes each pixel 100 times its distance from the image under its SMOOTH filter,
+        # whose sums never fall halfway between two values, so OpenCV rounds them the same, and which leaves the edges as they are
+        smooth = cv2.filter2D(colored, -1, Modifier.__SMOOTH, dst=Modifier.__take(colored.shape))
+        smooth[[0, -1]] = colored[[0, -1]]
+        smooth[:, [0, -1]] = colored[:, [0, -1]]
+        return cv2.addWeighted(colored, 100, smooth, -99, 0, dst=smooth)
+    def __fry_table(pixels: np.ndarray) -> np.ndarray:
+        # the color steps run with Pillow over every pair of red and channel levels, indexed by red level * 16 + channel level
+        levels = np.arange(0, 256, 16, dtype=np.uint8)
+        ramp = np.empty((16, 16, 3), dtype=np.uint8)
+        ramp[:, :, 0] = levels[:, np.newaxis]
+        ramp[:, :, 1:] = levels[np.newaxis, :, np.newaxis]
+        # the contrast is around the mean of the posterized red channel, as ImageEnhance.Contrast takes it
+        counts = cv2.calcHist([pixels], [0], None, [256], [0, 256]).reshape(16, 16).sum(axis=1)
+        mean = int(counts @ levels.astype(np.float64) / counts.sum() + .5)
+        red = Modifier.__to_image(np.ascontiguousarray(ramp[:, :, 0]))
+        red = Image.blend(Image.new('L', red.size, mean), red, 2.0)
+        red = Image.blend(Image.new('L', red.size, 0), red, 1.5)
+        red = ImageOps.colorize(red, *Modifier.__FRY_RED)
+        table = np.asarray(Image.blend(Modifier.__to_image(ramp), red, .75))
+        return np.ascontiguousarray(table.reshape(256, 1, 3))
+    def blur(self, outputpath: str = 'blur.jpg', show: bool = False, radius: int = 17, sigma: float = None, method: str = 'auto'):
         '''
         Creates an blurred version of this instance's image
         Output goes to filename outputpath, defaults to blur.jpg
         Bool can be passed in if image should be shown upon finishing
+        Radius can be passed in for the reach of the blur in pixels, defaults to 17
+        Sigma can be passed in for the Gaussian's standard deviation, defaults to OpenCV's choice for the radius
+        Method can be passed in as gaussian (exact), box (three box blurs, whose cost does not grow with the radius),
+        downsample (blurred at a reduced size, for very large radii), or auto, which picks by radius and image size, defaults to auto
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
-        blur = cv2.GaussianBlur(copy, (35, 35), 0)
-        cv2.imwrite(outputpath, blur)
-        if show:
-            cv2.imshow(outputpath, blur)
-        return Modifier(outputpath)
+        return self.__apply('blur', outputpath, show, radius=radius, sigma=sigma, method=method)
     gaussian_blur = blur
+    def __blur(pixels: np.ndarray, radius: int = 17, sigma: float = None, method: str = 'auto') -> np.ndarray:
+        method = Modifier.__blur_method(pixels.shape, radius, sigma, method)
+        if method == 'gaussian':
+            # a sigma of 0 lets OpenCV derive it from the kernel size
+            return cv2.GaussianBlur(pixels, (2 * radius + 1, 2 * radius + 1), sigma or 0, dst=Modifier.__take(pixels.shape))
+        sigma = Modifier.__sigma(radius, sigma)
+        if method == 'box':
+            blurred = pixels
+            for width in Modifier.__boxes(sigma):
+                passed = cv2.blur(blurred, (width, width), dst=Modifier.__take(pixels.shape))
+                if blurred is not pixels:
+                    Modifier.__recycle((blurred,), passed)
+                blurred = passed
+            return blurred
+        factor = Modifier.__blur_factor(sigma)
+        # the block average and the linear upsampling blur by about factor / 2 themselves
+        small_sigma = max(.5, (sigma ** 2 - factor ** 2 / 4) ** .5 / factor)
+        small = Modifier.__shrink(pixels, factor)
+        blurred = cv2.GaussianBlur(small, (0, 0), small_sigma, dst=Modifier.__take(small.shape))
+        Modifier.__recycle((small,), blurred)
+        grown = Modifier.__grow(blurred, pixels.shape, factor)
+        Modifier.__recycle((blurred,), grown)
+        return grown
+    def __shrink(pixels: np.ndarray, factor: int) -> np.ndarray:
+        # block averages at an integer factor, so bands of Modifier.tiled that start on the factor match the whole image
+        height, width = pixels.shape[:2]
+        padded = pixels
+        if height % factor or width % factor:
+            shape = (height + -height % factor, width + -width % factor) + pixels.shape[2:]
+            padded = cv2.copyMakeBorder(pixels, 0, -height % factor, 0, -width % factor, cv2.BORDER_REPLICATE, dst=Modifier.__take(shape))
+        shape = (padded.shape[0] // factor, padded.shape[1] // factor) + pixels.shape[2:]
+        small = cv2.resize(padded, shape[1::-1], dst=Modifier.__take(shape), interpolation=cv2.INTER_AREA)
+        if padded is not pixels:
+            Modifier.__recycle((padded,), small)
+        return small
+    def __grow(small: np.ndarray, shape: tuple, factor: int) -> np.ndarray:
+        size = (small.shape[0] * factor, small.shape[1] * factor) + small.shape[2:]
+        grown = cv2.resize(small, size[1::-1], dst=Modifier.__take(size), interpolation=cv2.INTER_LINEAR)
+        return grown[:shape[0], :shape[1]]
+    def __blur_method(shape: tuple, radius: int, sigma: float, method: str) -> str:
+        if method not in ('auto', 'gaussian', 'box', 'downsample'):
+            raise ValueError('method must be auto, gaussian, box or downsample, got %r' % method)
+        if radius < 1:
+            raise ValueError('radius must be at least 1, got %r' % radius)
+        if method != 'auto':
+            return method
+        # an exact kernel is as fast as three box blurs up to the default radius, and keeps its output unchanged
+        if radius <= 17:
+            return 'gaussian'
+        factor = Modifier.__blur_factor(Modifier.__sigma(radius, sigma))
+        if factor > 1 and min(shape[:2]) >= 16 * factor:
+            return 'downsample'
+        return 'box'
+    def __sigma(radius: int, sigma: float) -> float:
+        # OpenCV's sigma for a kernel of 2 * radius + 1
+        return sigma or .3 * (radius - 1) + .8
+    def __boxes(sigma: float) -> list:
+        # widths of three box blurs whose variance adds up to sigma squared, after Kovesi's almost Gaussian filtering
+        lower = int((12 * sigma ** 2 / 3 + 1) ** .5)
+        lower -= 1 - lower % 2
+        count = round((12 * sigma ** 2 - 3 * lower ** 2 - 12 * lower - 9) / (-4 * lower - 4))
+        return [lower if index < count else lower + 2 for index in range(3)]
+    def __blur_factor(sigma: float) -> int:
+        # leaves a sigma of about 6 at the reduced size
+        return max(1, int(sigma // 6))
     def sharpen(self, outputpath: str = 'sharpen.jpg', show: bool = False):
         '''
         Creates an sharpened version of this instance's image
@@ -467,13 +1605,10 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
+        return self.__apply('sharpen', outputpath, show)
+    def __sharpen(pixels: np.ndarray) -> np.ndarray:
         kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-        sharpen = cv2.filter2D(copy, -1, kernel)
-        cv2.imwrite(outputpath, sharpen)
-        if show:
-            cv2.imshow(outputpath, sharpen)
-        return Modifier(outputpath)
+        return cv2.filter2D(pixels, -1, kernel, dst=Modifier.__take(pixels.shape))
     def emboss(self, outputpath: str = 'emboss.jpg', show: bool = False):
         '''
         Creates an embossed version of this instance's image
@@ -481,52 +1616,44 @@ class Modifier:
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
+        return self.__apply('emboss', outputpath, show)
+    def __emboss(pixels: np.ndarray) -> np.ndarray:
         kernel = np.array([[0, -1, -1], [1, 0, -1], [1, 1, 0]])
-        emboss = cv2.filter2D(copy, -1, kernel)
-        cv2.imwrite(outputpath, emboss)
-        if show:
-            cv2.imshow(outputpath, emboss)
-        return Modifier(outputpath)
+        return cv2.filter2D(pixels, -1, kernel, dst=Modifier.__take(pixels.shape))
     def cool(self, outputpath: str = 'cool.jpg', show: bool = False):
         '''
-        Creates an warm version of this instance's image
+        Creates a cool version of this instance's image
         Output goes to filename outputpath, defaults to cool.jpg
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        increase = Modifier.__spread([0, 64, 128, 256], [0, 80, 160, 256])
-        decrease = Modifier.__spread([0, 64, 128, 256], [0, 50, 100, 256])
-        copy = cv2.imread(self.inputpath)
-        r, g, b = cv2.split(copy)
-        r = cv2.LUT(r, increase).astype(np.uint8)
-        b = cv2.LUT(b, decrease).astype(np.uint8)
-        cool = cv2.merge((r, g, b))
-        cv2.imwrite(outputpath, cool)
-        if show:
-            cv2.imshow(outputpath, cool)
-        return Modifier(outputpath)
-    def __spread(x , y) -> uspline:
-        spline = uspline(x, y)
-        return spline(range(256))
+        return self.__apply('cool', outputpath, show)
+    def __cool(pixels: np.ndarray) -> np.ndarray:
+        return Modifier.__lookup(pixels, np.stack((Modifier.__DECREASE, np.arange(256, dtype=np.uint8), Modifier.__INCREASE), axis=1))
+    # cubic splines through (0, 0), (64, 80), (128, 160), (256, 256) and through (0, 0), (64, 50), (128, 100), (256, 256),
+    # fitted with scipy.interpolate.UnivariateSpline and truncated to bytes, so SciPy is not needed to run
+    __INCREASE = np.frombuffer(bytes.fromhex(
+        '0001020304050708090a0b0d0e0f10111314151618191a1b1c1e1f20212324252728292a2c2d2e2f313233343637383a3b3c3d3f40414344454648494a4c4d4e'
+        '50515253555657595a5b5c5e5f60626364656768696b6c6d6e70717273757677787a7b7c7e7f80818384858687898a8b8c8e8f90919294959697989a9b9c9d9e'
+        '9fa1a2a3a4a5a6a8a9aaabacadaeafb1b2b3b4b5b6b7b8b9babbbcbdbebfc0c1c2c4c5c6c6c7c8c9cacbcccdcecfd0d1d2d3d4d5d5d6d7d8d9dadbdbdcdddedf'
+        'dfe0e1e2e3e3e4e5e6e6e7e8e8e9eaeaebececedeeeeeff0f0f1f1f2f2f3f3f4f4f5f6f6f6f7f7f8f8f9f9fafafafbfbfbfcfcfcfdfdfdfefefefeffffffffff'
+    ), dtype=np.uint8)
+    __DECREASE = np.frombuffer(bytes.fromhex(
+        '0000010203040505060708090a0a0b0c0d0e0e0f101112121314151516171819191a1b1c1c1d1e1f20202122232324252626272829292a2b2c2c2d2e2f2f3031'
+        '32323334343536373738393a3a3b3c3d3d3e3f404041424343444546474748494a4a4b4c4d4e4e4f505151525354555556575859595a5b5c5d5e5e5f60616263'
+        '646465666768696a6a6b6c6d6e6f70717273737475767778797a7b7c7d7e7f808182838485868788898a8b8c8d8e8f9091939495969798999a9b9d9e9fa0a1a2'
+        'a4a5a6a7a8a9abacadaeb0b1b2b3b5b6b7b9babbbdbebfc1c2c3c5c6c7c9cacccdcfd0d1d3d4d6d7d9dadcdddfe0e2e4e5e7e8eaebedeff0f2f4f5f7f9fafcfe'
+    ), dtype=np.uint8)
     def warm(self, outputpath: str = 'warm.jpg', show: bool = False):
         '''
-        Creates an cool version of this instance's image
+        Creates a warm version of this instance's image
         Output goes to filename outputpath, defaults to warm.jpg
         Bool can be passed in if image should be shown upon finishing
         Returns a modifier of the output image
         '''
-        increase = Modifier.__spread([0, 64, 128, 256], [0, 80, 160, 256])
-        decrease = Modifier.__spread([0, 64, 128, 256], [0, 50, 100, 256])
-        copy = cv2.imread(self.inputpath)
-        r, g, b = cv2.split(copy)
-        r = cv2.LUT(r, decrease).astype(np.uint8)
-        b = cv2.LUT(b, increase).astype(np.uint8)
-        warm = cv2.merge((r, g, b))
-        cv2.imwrite(outputpath, warm)
-        if show:
-            cv2.imshow(outputpath, warm)
-        return Modifier(outputpath)
+        return self.__apply('warm', outputpath, show)
+    def __warm(pixels: np.ndarray) -> np.ndarray:
+        return Modifier.__lookup(pixels, np.stack((Modifier.__INCREASE, np.arange(256, dtype=np.uint8), Modifier.__DECREASE), axis=1))
     def brightness(self, outputpath: str = 'brightness.jpg', show: bool = False, level: int = 50):
         '''
         Creates an adjusted brightness version of this instance's image
@@ -535,12 +1662,9 @@ class Modifier:
         Level can be passed in for brightness adjustment factor, defaults to 50
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
-        bright = cv2.convertScaleAbs(copy, beta=level)
-        cv2.imwrite(outputpath, bright)
-        if show:
-            cv2.imshow(outputpath, bright)
-        return Modifier(outputpath)
+        return self.__apply('brightness', outputpath, show, level=level)
+    def __brightness(pixels: np.ndarray, level: int) -> np.ndarray:
+        return cv2.convertScaleAbs(pixels, dst=Modifier.__take(pixels.shape), beta=level)
     def black_border(self, outputpath: str = 'blackborder.jpg', show: bool = False, width: int = 20):
         '''
         Creates a black border version of this instance's image
@@ -549,15 +1673,12 @@ class Modifier:
         Width int can be passed in for border size in pixels, defaults to 5
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
+        return self.__apply('black_border', outputpath, show, width=width)
+    def __black_border(pixels: np.ndarray, width: int) -> np.ndarray:
         BLACK = (0, 0, 0)
-        border = cv2.copyMakeBorder(
-            copy, width, width, width, width, cv2.BORDER_CONSTANT, value=BLACK
+        return cv2.copyMakeBorder(
+            pixels, width, width, width, width, cv2.BORDER_CONSTANT, dst=Modifier.__bordered(pixels, width), value=BLACK
         )
-        cv2.imwrite(outputpath, border)
-        if show:
-            cv2.imshow(outputpath, border)
-        return Modifier(outputpath)
     def white_border(self, outputpath: str = 'whiteborder.jpg', show: bool = False, width: int = 20):
         '''
         Creates a white border version of this instance's image
@@ -566,32 +1687,651 @@ class Modifier:
         Width int can be passed in for border size in pixels, defaults to 20
         Returns a modifier of the output image
         '''
-        copy = cv2.imread(self.inputpath)
+        return self.__apply('white_border', outputpath, show, width=width)
+    def __white_border(pixels: np.ndarray, width: int) -> np.ndarray:
         WHITE = (255, 255, 255)
-        border = cv2.copyMakeBorder(
-            copy, width, width, width, width, cv2.BORDER_CONSTANT, value=WHITE
+        return cv2.copyMakeBorder(
+            pixels, width, width, width, width, cv2.BORDER_CONSTANT, dst=Modifier.__bordered(pixels, width), value=WHITE
         )
-        cv2.imwrite(outputpath, border)
-        if show:
-            cv2.imshow(outputpath, border)
-        return Modifier(outputpath)
-    def cartoon(self, outputpath: str = 'cartoon.jpg', show: bool = False):
+    def __bordered(pixels: np.ndarray, width: int) -> np.ndarray:
+        return Modifier.__take((pixels.shape[0] + 2 * width, pixels.shape[1] + 2 * width) + pixels.shape[2:])
+    def cartoon(self, outputpath: str = 'cartoon.jpg', show: bool = False, quality: str = 'full'):
         '''
         Creates a cartoon version of this instance's image
         Output goes to filename outputpath, defaults to cartoon.jpg
         Bool can be passed in if image should be shown upon finishing
+        Quality can be passed in as full, balanced (colors smoothed at half size), or fast (at quarter size), defaults to full
+        The edges are always found at full size
         Returns a modifier of the output image
         '''
-        cartoon = cv2.imread(self.inputpath)
-        gray = cv2.cvtColor(cartoon, cv2.COLOR_BGR2GRAY)
-        gray_copy = cv2.medianBlur(gray, 5)
+        return self.__apply('cartoon', outputpath, show, quality=quality)
+    # quality: (factor the colors are smoothed at, bilateral filter diameter there)
+    __CARTOON = {'full': (1, 9), 'balanced': (2, 5), 'fast': (4, 3)}
+    def __cartoon(pixels: np.ndarray, quality: str = 'full') -> np.ndarray:
+        if quality not in Modifier.__CARTOON:
+            raise ValueError('quality must be full, balanced or fast, got %r' % quality)
+        factor, diameter = Modifier.__CARTOON[quality]
+        cartoon = pixels
+        start = Modifier.__clock()
+        # found at full size for every quality, so variants of one image share them
+        edges = Modifier.__shared('edges', cartoon, Modifier.__edges)
+        if start is not None:
+            Modifier.__record('edges', 'cartoon', start, edges.size, 3 * edges.nbytes)
+            start = Modifier.__clock()
+        if factor == 1:
+            color = cv2.bilateralFilter(cartoon, d=9, sigmaColor=200, sigmaSpace=200, dst=Modifier.__take(cartoon.shape))
+        else:
+            # the edge mask is applied at full size after upsampling, which keeps the outlines sharp
+            small = Modifier.__shrink(cartoon, factor)
+            smoothed = cv2.bilateralFilter(small, d=diameter, sigmaColor=200, sigmaSpace=200 / factor, dst=Modifier.__take(small.shape))
+            color = Modifier.__grow(smoothed, cartoon.shape, factor)
+            Modifier.__recycle((small, smoothed))
+        if start is not None:
+            Modifier.__record('filter', 'cartoon', start, edges.size, color.nbytes)
+        cartoon_final = Modifier.__take(cartoon.shape)
+        if cartoon_final is not None:
+            # pixels outside the mask keep what the buffer held, where a new one would start black
+            cartoon_final.fill(0)
+        cartoon_final = cv2.bitwise_and(color, color, dst=cartoon_final, mask=edges)
+        Modifier.__recycle((edges, color))
+        del cartoon, edges, color #clear memory
+        return cartoon_final
+    def __edges(pixels: np.ndarray) -> np.ndarray:
+        plane = pixels.shape[:2]
+        gray = cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY, dst=Modifier.__take(plane))
+        gray_copy = cv2.medianBlur(gray, 5, dst=Modifier.__take(plane))
         edges = cv2.adaptiveThreshold(
-            gray_copy, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 5
+            gray_copy, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 5, dst=Modifier.__take(plane)
         )
-        color = cv2.bilateralFilter(cartoon, d=9, sigmaColor=200, sigmaSpace=200)
-        cartoon_final = cv2.bitwise_and(color, color, mask=edges)
-        cv2.imwrite(outputpath, cartoon_final)
-        del cartoon, gray, gray_copy, edges, color #clear memory
-        if show:
-            cv2.imshow(outputpath)
-        return Modifier(outputpath)
\ No newline at end of file
+        Modifier.__recycle((gray, gray_copy))
+        return edges
+    # effect name -> (transform, encoder options); OpenCV effects keep cv2.imwrite's JPEG quality
+    __OPENCV = {'quality': 95}
+    __effects = {
+        'negative': (__negative, {}),
+        'mirror_vertical': (__mirror_vertical, {}),
+        'mirror_horizontal': (__mirror_horizontal, {}),
+        'grayscale': (__grayscale, {}),
+        'sepia': (__sepia, {}),
+        'average': (__average, {}),
+        'halftone': (__halftone, {}),
+        'primary': (__primary, {}),
+        'dither': (__dither, {}),
+        'tint': (__tint, {}),
+        'recolor': (__recolor, {}),
+        'rotate': (__rotate, {}),
+        'mirror_diagonal': (__mirror_diagonal, {}),
+        'detect_edges': (__detect_edges, __OPENCV),
+        'deepfry': (__deepfry, {}),
+        'blur': (__blur, __OPENCV),
+        'sharpen': (__sharpen, __OPENCV),
+        'emboss': (__emboss, __OPENCV),
+        'cool': (__cool, __OPENCV),
+        'warm': (__warm, __OPENCV),
+        'brightness': (__brightness, __OPENCV),
+        'black_border': (__black_border, __OPENCV),
+        'white_border': (__white_border, __OPENCV),
+        'cartoon': (__cartoon, __OPENCV),
+        'curve': (__curve, {}),
+    }
+
+class AsyncModifier:
+    '''
+    An asyncio version of Modifier, which runs reading, decoding, effects and encoding in a shared thread pool,
+    off the event loop, where Pillow, OpenCV and NumPy release the GIL and run in parallel
+    Every public method of Modifier is a coroutine here with the same arguments,
+    and effects return an AsyncModifier of the output image
+    Generators, batch and frames, are async iterators instead, each item is made off the event loop
+    '''
+    __executor = None
+    __workers = None
+    __limit = None
+    __slots = None
+    __loop = None
+    def __init__(self, inputpath: str = None, lazy: bool = False, image: Image = None, pixels: np.ndarray = None, inplace: bool = False):
+        '''
+        Creates an async modifier of the image at inputpath, of an in-memory PIL image, or of an RGB pixel array
+        The file is only read by the first awaited call
+        '''
+        self.__arguments = (inputpath, lazy, image, pixels, inplace)
+        self.__modifier = None
+        self.__opening = None
+        self.inputpath = inputpath
+    @staticmethod
+    def configure(workers: int = None, limit: int = None) -> None:
+        '''
+        Sets the threads shared by all async modifiers, defaults to the number of CPUs,
+        and the most calls queued or running at once, defaults to twice workers
+        Further calls wait on the event loop for a free slot
+        '''
+        executor = AsyncModifier.__executor
+        AsyncModifier.__workers = workers or os.cpu_count() or 1
+        AsyncModifier.__limit = limit or 2 * AsyncModifier.__workers
+        AsyncModifier.__executor = ThreadPoolExecutor(AsyncModifier.__workers, thread_name_prefix='modifier')
+        AsyncModifier.__slots = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+    async def modifier(self) -> Modifier:
+        '''
+        Returns the Modifier of this instance's image, read and decoded off the event loop
+        '''
+        modifier = await self.__open()
+        await AsyncModifier.__run(lambda: modifier.pixels)
+        return modifier
+    async def fan_out(self, *effects) -> list:
+        '''
+        Runs several effects on this instance's image at once, decoding it only once
+        Effects are names or (name, params) pairs, as in Modifier.batch, and keep their output in memory
+        unless an outputpath is given in their params
+        Returns an AsyncModifier of each output image, in the given order
+        '''
+        modifier = await self.modifier()
+        calls = []
+        for effect in effects:
+            name, params = (effect, {}) if isinstance(effect, str) else effect
+            calls.append(AsyncModifier.__run(getattr(modifier, name), **{'outputpath': None, **params}))
+        return [AsyncModifier.__wrap(result) for result in await asyncio.gather(*calls)]
+    def __getattr__(self, name: str):
+        method = Modifier.__dict__.get(name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError('%r object has no attribute %r' % (type(self).__name__, name))
+        if isinstance(method, staticmethod) and inspect.isgeneratorfunction(method.__func__):
+            async def call(*args, **kwargs):
+                # the generator only runs in next, so each item is pulled through the pool
+                iterator = getattr(Modifier, name)(*args, **kwargs)
+                done = object()
+                try:
+                    while True:
+                        item = await AsyncModifier.__run(next, iterator, done)
+                        if item is done:
+                            return
+                        yield AsyncModifier.__wrap(item)
+                finally:
+                    try:
+                        await AsyncModifier.__run(iterator.close)
+                    except ValueError:
+                        # cancelled while an item was being made, the generator is closed once it is collected
+                        pass
+        else:
+            async def call(*args, **kwargs):
+                if isinstance(method, staticmethod):
+                    return await AsyncModifier.__run(getattr(Modifier, name), *args, **kwargs)
+                modifier = await self.__open()
+                return AsyncModifier.__wrap(await AsyncModifier.__run(getattr(modifier, name), *args, **kwargs))
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+    async def __open(self) -> Modifier:
+        if self.__modifier is None:
+            # concurrent first calls share one read, and cancelling one of them does not cancel it for the others
+            if self.__opening is None:
+                self.__opening = asyncio.ensure_future(AsyncModifier.__run(Modifier, *self.__arguments))
+            self.__modifier = await asyncio.shield(self.__opening)
+        return self.__modifier
+    def __wrap(result):
+        if not isinstance(result, Modifier):
+            return result
+        wrapped = AsyncModifier(result.inputpath)
+        wrapped.__modifier = result
+        return wrapped
+    async def __run(function, *args, **kwargs):
+        if AsyncModifier.__executor is None:
+            AsyncModifier.configure()
+        loop = asyncio.get_running_loop()
+        if AsyncModifier.__slots is None or AsyncModifier.__loop is not loop:
+            AsyncModifier.__slots = asyncio.Semaphore(AsyncModifier.__limit)
+            AsyncModifier.__loop = loop
+        slots = AsyncModifier.__slots
+        await slots.acquire()
+        try:
+            future = AsyncModifier.__executor.submit(function, *args, **kwargs)
+        except BaseException:
+            slots.release()
+            raise
+        # the slot is held until the thread is done, a cancelled call that already started still runs to the end
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(slots.release))
+        return await asyncio.wrap_future(future)
+
+class Profile:
+    '''
+    Records every stage run by modifiers while it is open, as a context manager
+    Made by Modifier.profile, see Modifier.add_hook
+    '''
+    def __init__(self):
+        self.records = []
+    def __enter__(self):
+        Modifier.add_hook(self.records.append)
+        return self
+    def __exit__(self, *exception) -> None:
+        Modifier.remove_hook(self.records.append)
+    def summary(self) -> dict:
+        '''
+        Returns the calls, seconds, pixels, and bytes of the records, summed for each (stage, effect) pair
+        The resize, color, filter, and edges stages are parts of the transform stage of their effect
+        '''
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault((record.stage, record.effect), {'calls': 0, 'seconds': 0.0, 'pixels': 0, 'bytes': 0})
+            total['calls'] += 1
+            total['seconds'] += record.seconds
+            total['pixels'] += record.pixels
+            total['bytes'] += record.bytes
+        return totals
+    def write_json_lines(self, file) -> None:
+        '''
+        Writes each record to the writable text file object as a line of JSON
+        '''
+        for record in self.records:
+            file.write(json.dumps(record._asdict()) + '\n')
+    def write_prometheus(self, outputpath: str) -> None:
+        '''
+        Writes the summary to filename outputpath in the Prometheus text format, as for a textfile collector
+        The file is replaced at once, so it is never read half written
+        '''
+        lines = []
+        for field, kind in (('calls', 'calls_total'), ('seconds', 'seconds_total'), ('pixels', 'pixels_total'), ('bytes', 'bytes_total')):
+            name = 'modifier_stage_' + kind
+            lines.append('# TYPE %s counter' % name)
+            for (stage, effect), total in self.summary().items():
+                lines.append('%s{stage="%s",effect="%s"} %r' % (name, stage, effect or '', total[field]))
+        with open(outputpath + '.tmp', 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(outputpath + '.tmp', outputpath)
+
+class ResultCache:
+    '''
+    A content addressed cache of encoded results, see Modifier.use_cache
+    Keeps up to memory bytes of results in memory, and up to disk bytes of them as files in directory, if one is given
+    The least recently used results are dropped first, and results from disk are kept in memory again
+    '''
+    def __init__(self, memory: int = 256 * 2**20, directory: str = None, disk: int = 2**30):
+        self.memory = memory
+        self.directory = directory
+        self.disk = disk
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__files = OrderedDict()
+        self.__sizes = {'memory': 0, 'disk': 0}
+        self.__counts = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            # files from earlier runs, oldest first
+            names = [name for name in os.listdir(directory) if not name.endswith('.tmp')]
+            for name in sorted(names, key=lambda name: os.path.getmtime(os.path.join(directory, name))):
+                self.__files[name] = os.path.getsize(os.path.join(directory, name))
+                self.__sizes['disk'] += self.__files[name]
+    def get(self, key: str) -> bytes:
+        '''
+        Returns the result stored under key, or None
+        '''
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.__counts['memory_hits'] += 1
+                return self.__entries[key]
+            if key in self.__files:
+                path = os.path.join(self.directory, key)
+                try:
+                    with open(path, 'rb') as file:
+                        data = file.read()
+                    os.utime(path)
+                except FileNotFoundError:
+                    # removed by another process sharing the directory
+                    self.__sizes['disk'] -= self.__files.pop(key)
+                else:
+                    self.__files.move_to_end(key)
+                    self.__counts['disk_hits'] += 1
+                    self.__keep(key, data)
+                    return data
+            self.__counts['misses'] += 1
+            return None
+    def put(self, key: str, data: bytes) -> None:
+        '''
+        Stores the result data under key, in memory and on disk
+        '''
+        with self.__lock:
+            self.__keep(key, data)
+            if self.directory is None or key in self.__files or len(data) > self.disk:
+                return
+            path = os.path.join(self.directory, key)
+            temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+            self.__files[key] = len(data)
+            self.__sizes['disk'] += len(data)
+            while self.__sizes['disk'] > self.disk:
+                name, size = self.__files.popitem(last=False)
+                self.__sizes['disk'] -= size
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+    def stats(self) -> dict:
+        '''
+        Returns the hits in memory and on disk, the misses, and the results and bytes held in each tier
+        '''
+        with self.__lock:
+            return {
+                **self.__counts,
+                'hits': self.__counts['memory_hits'] + self.__counts['disk_hits'],
+                'memory_entries': len(self.__entries),
+                'memory_bytes': self.__sizes['memory'],
+                'disk_entries': len(self.__files),
+                'disk_bytes': self.__sizes['disk'],
+            }
+    def clear(self) -> None:
+        '''
+        Drops every result, in memory and on disk
+        '''
+        with self.__lock:
+            self.__entries.clear()
+            for name in self.__files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            self.__files.clear()
+            self.__sizes = {'memory': 0, 'disk': 0}
+    def __keep(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory or key in self.__entries:
+            return
+        self.__entries[key] = data
+        self.__sizes['memory'] += len(data)
+        while self.__sizes['memory'] > self.memory:
+            self.__sizes['memory'] -= len(self.__entries.popitem(last=False)[1])
+
+class BufferPool:
+    '''
+    A pool of reusable pixel buffers, keyed by shape and dtype, see Modifier.use_pool
+    Keeps up to limit bytes of idle buffers, defaults to 256 MiB
+    Only buffers the pool lent out are taken back, so arrays it did not make are never reused
+    '''
+    def __init__(self, limit: int = 256 * 2**20):
+        self.limit = limit
+        self.__lock = threading.Lock()
+        self.__free = {}
+        # buffers handed out and not yet given back, by id, dropped when they are collected
+        self.__lent = weakref.WeakValueDictionary()
+        self.__bytes = 0
+        self.__counts = {'hits': 0, 'misses': 0}
+    def __reduce__(self):
+        # a pool is sent to worker processes as an empty one with the same limit
+        return BufferPool, (self.limit,)
+    def take(self, shape: tuple, dtype = np.uint8) -> np.ndarray:
+        '''
+        Returns a writable buffer of shape and dtype, reused when one is idle, its contents are undefined
+        '''
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self.__lock:
+            free = self.__free.get(key)
+            if free:
+                buffer = free.pop()
+                self.__bytes -= buffer.nbytes
+                self.__counts['hits'] += 1
+            else:
+                buffer = None
+                self.__counts['misses'] += 1
+        if buffer is None:
+            buffer = np.empty(shape, dtype)
+        buffer.flags.writeable = True
+        with self.__lock:
+            self.__lent[id(buffer)] = buffer
+        return buffer
+    def lends(self, array: np.ndarray) -> bool:
+        '''
+        Returns whether the buffer array is, or is a view of, is lent out by this pool
+        '''
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        with self.__lock:
+            return self.__lent.get(id(array)) is array
+    def give(self, array: np.ndarray) -> None:
+        '''
+        Hands back the buffer array is, or is a view of, for take to reuse, unless the pool did not lend it
+        Array, and every other view of its buffer, must not be used afterwards
+        '''
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        with self.__lock:
+            if self.__lent.get(id(array)) is not array:
+                return
+            del self.__lent[id(array)]
+            if self.__bytes + array.nbytes > self.limit:
+                return
+            self.__free.setdefault((array.shape, array.dtype.str), []).append(array)
+            self.__bytes += array.nbytes
+    def stats(self) -> dict:
+        '''
+        Returns the takes served by an idle buffer and those that allocated one, and the idle buffers and bytes held
+        '''
+        with self.__lock:
+            return {**self.__counts, 'buffers': sum(len(free) for free in self.__free.values()), 'bytes': self.__bytes}
+    def clear(self) -> None:
+        '''
+        Drops every idle buffer
+        '''
+        with self.__lock:
+            self.__free.clear()
+            self.__bytes = 0
+
+class _Counter:
+    # a file object that counts the bytes written through it, and passes everything else to file
+    def __init__(self, file):
+        self.file = file
+        self.written = 0
+    def write(self, data) -> int:
+        self.written += memoryview(data).nbytes
+        return self.file.write(data)
+    def __getattr__(self, name: str):
+        return getattr(self.file, name)
+
+class _BandWriter:
+    # writes the bands of Modifier.tiled in order, streaming PNG, TIFF, PPM/PGM and .npy output
+    def __init__(self, outputpath: str, height: int):
+        self.outputpath = outputpath
+        self.height = height
+        self.format = os.path.splitext(outputpath)[1].lower()
+        self.file = None
+        self.bands = []
+    def write(self, band: np.ndarray) -> None:
+        if self.format == '.npy':
+            if self.file is None:
+                self.file = np.lib.format.open_memmap(self.outputpath, mode='w+', dtype=np.uint8, shape=(self.height, *band.shape[1:]))
+                self.row = 0
+            self.file[self.row:self.row + band.shape[0]] = band
+            self.row += band.shape[0]
+        elif self.format in ('.png', '.tif', '.tiff', '.ppm', '.pgm', '.pnm'):
+            if self.file is None:
+                self.file = open(self.outputpath, 'wb')
+                self.__start(band)
+            if self.format == '.png':
+                self.__png(band)
+            else:
+                if self.format in ('.tif', '.tiff'):
+                    # one strip per band, bands are all the same height but the last
+                    self.strips.append((self.file.tell(), band.nbytes))
+                self.file.write(np.ascontiguousarray(band).tobytes())
+        else:
+            if not self.bands:
+                warnings.warn('%s output is assembled in memory before encoding, use PNG, TIFF, PPM or .npy to stream it' % self.format)
+            self.bands.append(np.array(band))
+    def close(self) -> None:
+        if self.format == '.png' and self.file is not None:
+            self.__chunk(b'IDAT', self.compressor.flush())
+            self.__chunk(b'IEND', b'')
+        if self.format in ('.tif', '.tiff') and self.file is not None:
+            self.__tiff_directory()
+        if self.format == '.npy' and self.file is not None:
+            self.file.flush()
+        elif self.file is not None:
+            self.file.close()
+        elif self.bands:
+            Image.fromarray(np.concatenate(self.bands)).save(self.outputpath)
+        self.file = None
+        self.bands = []
+    def __start(self, band: np.ndarray) -> None:
+        channels = 1 if band.ndim == 2 else 3
+        if self.format == '.png':
+            self.file.write(b'\x89PNG\r\n\x1a\n')
+            self.__chunk(b'IHDR', struct.pack('>IIBBBBB', band.shape[1], self.height, 8, 0 if channels == 1 else 2, 0, 0, 0))
+            self.compressor = zlib.compressobj(6)
+            self.previous = np.zeros(band.shape[1] * channels, dtype=np.uint8)
+        elif self.format in ('.tif', '.tiff'):
+            # uncompressed strips, in BigTIFF when the offsets could pass 4 GiB
+            self.width, self.channels, self.rows = band.shape[1], channels, band.shape[0]
+            self.big = self.height * band.shape[1] * channels + 2**20 >= 2**32
+            self.file.write(b'II+\x00' + struct.pack('<HHQ', 8, 0, 0) if self.big else b'II*\x00' + struct.pack('<I', 0))
+            self.strips = []
+        else:
+            magic = b'P5' if channels == 1 else b'P6'
+            self.file.write(b'%s\n%d %d\n255\n' % (magic, band.shape[1], self.height))
+    def __tiff_directory(self) -> None:
+        # the image file directory goes after the strips, as their offsets are only known once they are written
+        offset = 'Q' if self.big else 'I'
+        entries = [
+            (256, 'I', [self.width]), (257, 'I', [self.height]), (258, 'H', [8] * self.channels), (259, 'H', [1]),
+            (262, 'H', [1 if self.channels == 1 else 2]), (273, offset, [start for start, size in self.strips]),
+            (277, 'H', [self.channels]), (278, 'I', [self.rows]), (279, offset, [size for start, size in self.strips]),
+            (284, 'H', [1]),
+        ]
+        kinds = {'H': 3, 'I': 4, 'Q': 16}
+        inline, entry, count, link = (8, '<HHQ', '<Q', '<Q') if self.big else (4, '<HHI', '<H', '<I')
+        position = -(-self.file.tell() // 2) * 2
+        self.file.seek(position)
+        extra = position + struct.calcsize(count) + len(entries) * (struct.calcsize(entry) + inline) + struct.calcsize(link)
+        directory, data = [struct.pack(count, len(entries))], []
+        for tag, kind, values in entries:
+            packed = struct.pack('<%d%s' % (len(values), kind), *values)
+            directory.append(struct.pack(entry, tag, kinds[kind], len(values)))
+            if len(packed) <= inline:
+                directory.append(packed.ljust(inline, b'\x00'))
+            else:
+                directory.append(struct.pack(link, extra))
+                data.append(packed)
+                extra += len(packed)
+        directory.append(struct.pack(link, 0))
+        self.file.write(b''.join(directory + data))
+        self.file.seek(8 if self.big else 4)
+        self.file.write(struct.pack(link, position))
+    def __png(self, band: np.ndarray) -> None:
+        # every row uses the Up filter, the difference from the row above
+        rows = np.ascontiguousarray(band).reshape(band.shape[0], -1)
+        above = np.vstack([self.previous[np.newaxis], rows[:-1]])
+        filtered = np.hstack([np.full((rows.shape[0], 1), 2, dtype=np.uint8), rows - above])
+        self.previous = rows[-1].copy()
+        self.__chunk(b'IDAT', self.compressor.compress(filtered.tobytes()))
+    def __chunk(self, kind: bytes, data: bytes) -> None:
+        if kind == b'IDAT' and not data:
+            return
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+class _FrameWriter:
+    # writes the frames of Modifier.stream one at a time, as an animated GIF through Pillow or a video through OpenCV
+    FOURCC = {'.mp4': 'mp4v', '.m4v': 'mp4v', '.mov': 'mp4v', '.avi': 'MJPG', '.mkv': 'XVID'}
+    def __init__(self, outputpath: str, fps: float):
+        self.outputpath = outputpath
+        self.fps = fps
+        self.format = os.path.splitext(outputpath)[1].lower()
+        if self.format != '.gif' and self.format not in _FrameWriter.FOURCC:
+            raise ValueError('frames can be written to .gif, %s, not %r' % (', '.join(_FrameWriter.FOURCC), self.format))
+        self.file = None
+        self.video = None
+        self.bgr = None
+        self.count = 0
+    def write(self, pixels: np.ndarray, duration: float) -> None:
+        if pixels.ndim == 2:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB)
+        if self.format == '.gif':
+            self.__gif(pixels, duration)
+        else:
+            if self.video is None:
+                fps = self.fps or 1000 / duration
+                fourcc = cv2.VideoWriter_fourcc(*_FrameWriter.FOURCC[self.format])
+                self.video = cv2.VideoWriter(self.outputpath, fourcc, fps, (pixels.shape[1], pixels.shape[0]))
+                if not self.video.isOpened():
+                    raise ValueError('cannot write a video to %r' % self.outputpath)
+            self.bgr = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR, self.bgr)
+            self.video.write(self.bgr)
+        self.count += 1
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.write(b';')
+            self.file.close()
+        if self.video is not None:
+            self.video.release()
+    def __gif(self, pixels: np.ndarray, duration: float) -> None:
+        # each frame gets its own palette, Pillow's own GIF writer would hold every frame until the end
+        frame = Image.fromarray(pixels).quantize(method=Image.Quantize.FASTOCTREE)
+        if self.file is None:
+            self.file = open(self.outputpath, 'wb')
+            header, _ = GifImagePlugin.getheader(frame, info={'loop': 0})
+            self.file.write(b''.join(header))
+        for data in GifImagePlugin.getdata(frame, duration=duration, include_color_table=True):
+            self.file.write(data)
+
+def _batch_file(inputpath: str, effects: list, outputpath: str) -> BatchResult:
+    # runs in a worker process of Modifier.batch, so it must be importable by name
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(outputpath) or os.curdir, exist_ok=True)
+        chained = Modifier(inputpath, lazy=True)
+        for name, params in effects:
+            chained = getattr(chained, name)(**params)
+        pixels = chained.pixels
+        chained.save(outputpath)
+        # the next image in this worker reuses the buffers, if a pool is in use
+        chained.release()
+        return BatchResult(inputpath, outputpath, None, time.perf_counter() - start, pixels.shape[0] * pixels.shape[1])
+    except Exception as error:
+        return BatchResult(inputpath, None, '%s: %s' % (type(error).__name__, error), time.perf_counter() - start, 0)
+
+def _parse_effect(text: str) -> tuple:
+    # name or name:key=value,key=value, values are python literals or plain strings
+    name, _, arguments = text.partition(':')
+    params = {}
+    for argument in filter(None, arguments.split(',')):
+        key, _, value = argument.partition('=')
+        params[key] = _parse_value(value)
+    return name, params
+
+def _parse_value(text: str):
+    # a python literal, or the plain string
+    text = {'true': 'True', 'false': 'False'}.get(text.lower(), text)
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m modifier', description='Apply a chain of effects to a batch of images')
+    parser.add_argument('source', help='a glob pattern or a directory of images')
+    parser.add_argument('effects', nargs='*', help='effects to chain, as name or name:key=value,key=value')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the results to')
+    parser.add_argument('-w', '--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--inflight', type=int, help='most images queued or in progress at once, defaults to twice workers')
+    parser.add_argument('--format', help='output extension, such as png, defaults to the input extension')
+    parser.add_argument('--unordered', action='store_true', help='report results as they finish instead of in input order')
+    args = parser.parse_args(argv)
+    effects = [_parse_effect(effect) for effect in args.effects]
+    start = time.perf_counter()
+    images = failed = pixels = 0
+    results = Modifier.batch(args.source, effects, args.output, args.workers, not args.unordered, args.inflight, args.format)
+    try:
+        for result in results:
+            images += 1
+            pixels += result.pixels
+            if result.error is not None:
+                failed += 1
+                print('%s: %s' % (result.inputpath, result.error), file=sys.stderr)
+    except ValueError as error:
+        parser.error(str(error))
+    seconds = time.perf_counter() - start
+    print('%d images (%d failed) in %.2fs: %.2f images/s, %.2f megapixels/s' % (
+        images, failed, seconds, images / seconds, pixels / 1e6 / seconds
+    ))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,298 @@
+from PIL import Image, UnidentifiedImageError
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from modifier import Modifier, _parse_value
+
+'''
+server.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Serves every effect of modifier.py over HTTP, with the standard library and a pool of worker processes
+'''
+
+# requests a latency percentile is taken over, the most recent ones
+WINDOW = 1024
+
+# params of every effect that clients cannot set, as they would write files or open windows on the server
+_RESERVED = ('self', 'outputpath', 'show', 'lossless')
+
+def _check(effect: str, params: dict) -> None:
+    # raises ValueError for a param effect does not take, or of another type than it is annotated with,
+    # so bad input is refused before it reaches a worker
+    parameters = inspect.signature(getattr(Modifier, effect)).parameters
+    for key, value in params.items():
+        parameter = parameters.get(key)
+        if parameter is None or key in _RESERVED:
+            raise ValueError('%s does not take %r' % (effect, key))
+        kind = parameter.annotation
+        if value is None and parameter.default is None:
+            continue
+        if kind is float:
+            allowed = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif kind is int:
+            allowed = isinstance(value, int) and not isinstance(value, bool)
+        else:
+            allowed = not isinstance(kind, type) or isinstance(value, kind)
+        if not allowed:
+            raise ValueError('%s must be %s, got %r' % (key, kind.__name__, value))
+
+def _warm() -> None:
+    # runs in each worker as it starts, importing the backends and building the tables of every effect on a tiny image,
+    # so the first request it serves runs at full speed
+    pixels = np.linspace(0, 255, 32 * 32 * 3).astype(np.uint8).reshape(32, 32, 3)
+    for effect in Modifier.effects():
+        if effect != 'curve':
+            getattr(Modifier(pixels=pixels).pipeline(), effect)().to_bytes()
+
+def _ready() -> int:
+    return os.getpid()
+
+def _render(data: bytes, effect: str, params: dict, format: str) -> tuple:
+    # runs in a worker, returns the encoded result and the seconds spent on it
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as image:
+        result = getattr(Modifier(image=image).pipeline(), effect)(**params).to_bytes(format)
+    return result, time.perf_counter() - start
+
+class Service:
+    '''
+    Runs effects for HTTP requests in a pool of worker processes, see make_server
+    Workers is the number of processes, defaults to the number of CPUs
+    Identical requests that arrive while one of them is being computed share its result
+    '''
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.__executor = self.__pool()
+        self.__lock = threading.Lock()
+        self.__running = {}
+        self.__latencies = deque(maxlen=WINDOW)
+        self.__counts = {'requests': 0, 'errors': 0, 'coalesced': 0, 'computed': 0, 'restarts': 0}
+        self.__waiting = 0
+        self.__busy = 0.0
+        self.__started = time.perf_counter()
+    def start(self) -> None:
+        '''
+        Starts every worker and waits until each has imported its backends
+        '''
+        wait([self.__executor.submit(_ready) for _ in range(self.workers)])
+        self.__started = time.perf_counter()
+    def close(self) -> None:
+        '''
+        Stops the workers once the requests in progress are done
+        '''
+        self.__executor.shutdown()
+    def __pool(self) -> ProcessPoolExecutor:
+        # spawned, as forking a process that runs server threads is unsafe
+        return ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'), initializer=_warm)
+    def __restart(self, broken: ProcessPoolExecutor) -> None:
+        # a worker that died, for example killed for running out of memory, breaks the whole pool,
+        # so a new one takes its place for the requests that follow
+        with self.__lock:
+            if self.__executor is not broken:
+                return
+            self.__executor = self.__pool()
+            self.__counts['restarts'] += 1
+        broken.shutdown(wait=False)
+    def render(self, data: bytes, effect: str, params: dict, format: str = 'JPEG') -> tuple:
+        '''
+        Applies effect with params to the encoded image data, and encodes the result in format
+        Returns the result, and whether it was shared with an identical request already in progress
+        '''
+        key = (hashlib.sha256(data).hexdigest(), effect, repr(sorted(params.items())), format.upper())
+        start = time.perf_counter()
+        with self.__lock:
+            self.__counts['requests'] += 1
+            self.__waiting += 1
+        executor = None
+        try:
+            with self.__lock:
+                running = self.__running.get(key)
+                coalesced = running is not None
+                if coalesced:
+                    self.__counts['coalesced'] += 1
+                    future, executor = running
+                else:
+                    executor = self.__executor
+                    future = executor.submit(_render, data, effect, params, format)
+                    self.__running[key] = (future, executor)
+            if not coalesced:
+                # outside the lock, as a future that is already done calls back at once
+                future.add_done_callback(lambda future: self.__finish(key, future))
+            return future.result()[0], coalesced
+        except Exception as error:
+            with self.__lock:
+                self.__counts['errors'] += 1
+            if isinstance(error, BrokenProcessPool) and executor is not None:
+                self.__restart(executor)
+            raise
+        finally:
+            with self.__lock:
+                self.__waiting -= 1
+                self.__latencies.append(time.perf_counter() - start)
+    def __finish(self, key: tuple, future) -> None:
+        with self.__lock:
+            del self.__running[key]
+            self.__counts['computed'] += 1
+            if future.exception() is None:
+                self.__busy += future.result()[1]
+    def status(self) -> dict:
+        '''
+        Returns the request counts, how often the worker pool was replaced after a worker died,
+        the computations queued for a worker and in progress, the requests waiting on them,
+        the latency of recent requests in milliseconds, and the share of the workers' time spent computing
+        '''
+        with self.__lock:
+            running = len(self.__running)
+            latencies = sorted(self.__latencies)
+            uptime = time.perf_counter() - self.__started
+            status = {
+                **self.__counts,
+                'workers': self.workers,
+                'uptime': uptime,
+                'queue_depth': max(0, running - self.workers),
+                'in_progress': min(running, self.workers),
+                'waiting_requests': self.__waiting,
+                'worker_utilization': self.__busy / (self.workers * uptime) if uptime > 0 else 0.0,
+            }
+        latency = {'count': len(latencies)}
+        if latencies:
+            latency['mean'] = 1000 * sum(latencies) / len(latencies)
+            for name, fraction in (('p50', .5), ('p95', .95), ('p99', .99)):
+                latency[name] = 1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+            latency['max'] = 1000 * latencies[-1]
+        status['latency_ms'] = latency
+        return status
+
+class _Handler(BaseHTTPRequestHandler):
+    # POST /effect?param=value with the image as the body, GET /status, and GET / for the effects
+    protocol_version = 'HTTP/1.1'
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path.rstrip('/')
+        if path == '/status':
+            self.__json(200, self.server.service.status())
+        elif path in ('', '/effects'):
+            self.__json(200, {'effects': Modifier.effects()})
+        else:
+            self.__json(404, {'error': 'no such endpoint %r' % path})
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        effect = url.path.strip('/')
+        params = {key: _parse_value(value) for key, value in parse_qsl(url.query)}
+        format = str(params.pop('format', 'JPEG'))
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.__json(411, {'error': 'Content-Length is required'})
+            return
+        length = length.strip()
+        if not (length.isascii() and length.isdigit()):
+            # the body cannot be found, so neither can the next request on this connection
+            self.close_connection = True
+            self.__json(400, {'error': 'Content-Length must be a non-negative integer, got %r' % length})
+            return
+        length = int(length)
+        if length > self.server.max_bytes:
+            self.close_connection = True
+            self.__json(413, {'error': 'images are limited to %d bytes' % self.server.max_bytes})
+            return
+        data = self.rfile.read(length)
+        if effect not in Modifier.effects():
+            self.__json(404, {'error': 'unknown effect %r' % effect})
+            return
+        if not data:
+            self.__json(400, {'error': 'the request body must be an image'})
+            return
+        try:
+            _check(effect, params)
+            result, coalesced = self.server.service.render(data, effect, params, format)
+        except (UnidentifiedImageError, ValueError, TypeError, KeyError, OverflowError, OSError) as error:
+            self.__json(400, {'error': '%s: %s' % (type(error).__name__, error)})
+            return
+        except Exception as error:
+            # OpenCV refuses values it cannot work with, such as a negative border width, with its own error
+            code = 400 if type(error).__module__ == 'cv2' else 500
+            self.__json(code, {'error': '%s: %s' % (type(error).__name__, error)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', Image.MIME.get(format.upper(), 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(result)))
+        self.send_header('X-Coalesced', 'true' if coalesced else 'false')
+        self.end_headers()
+        self.wfile.write(result)
+    def __json(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    def log_message(self, format: str, *args) -> None:
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+class _Server(ThreadingHTTPServer):
+    # room for bursts of connections beyond the default backlog of 5
+    request_queue_size = 128
+
+def make_server(host: str = '127.0.0.1', port: int = 8000, workers: int = None, max_bytes: int = 64 * 2**20, quiet: bool = False) -> ThreadingHTTPServer:
+    '''
+    Creates an HTTP server of every effect on host and port, a port of 0 picks a free one, see server.server_address
+    Its worker processes are started, and have imported their backends, by the time it returns
+    Workers is the number of processes, defaults to the number of CPUs
+    Max_bytes is the largest image accepted, defaults to 64 MiB
+    Bool quiet can be passed in to not log each request
+    Call serve_forever to serve, and server.service.close() after shutdown to stop the workers
+    '''
+    service = Service(workers)
+    service.start()
+    Image.init()
+    server = _Server((host, port), _Handler)
+    server.service = service
+    server.max_bytes = max_bytes
+    server.quiet = quiet
+    return server
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='python server.py', description='Serve every effect of modifier.py over HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on, defaults to 127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on, defaults to 8000')
+    parser.add_argument('-w', '--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--max-bytes', type=int, default=64 * 2**20, help='largest image accepted in bytes, defaults to 64 MiB')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, args.workers, args.max_bytes, args.quiet)
+    print('serving %d effects on http://%s:%d with %d workers' % (
+        len(Modifier.effects()), *server.server_address[:2], server.service.workers
+    ), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
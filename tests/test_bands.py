@@ -0,0 +1,104 @@
+from PIL import Image
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier
+
+'''
+test_bands.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks that effects run in bands, by tiled and set_threads, match running them on the whole image
+'''
+
+Modifier.register_curve('test-bands', np.interp(np.arange(256), [0, 64, 128, 192, 255], [0, 80, 150, 210, 255]))
+
+# every effect that can run in bands, with each mode that changes its halo or alignment
+CASES = [
+    ('negative', {}), ('primary', {}), ('tint', {}), ('recolor', {'dr': -40, 'dg': 30, 'db': 300}),
+    ('cool', {}), ('warm', {}), ('brightness', {'level': -30}), ('curve', {'name': 'test-bands'}),
+    ('grayscale', {}), ('sepia', {}), ('mirror_horizontal', {}),
+    ('halftone', {'mode': 'block'}), ('halftone', {'mode': 'ordered', 'size': 4}),
+    ('dither', {'mode': 'block'}), ('dither', {'mode': 'ordered', 'size': 8}),
+    ('blur', {'method': 'gaussian'}), ('blur', {'method': 'box'}), ('blur', {'method': 'downsample'}),
+    ('blur', {'method': 'downsample', 'radius': 60}),
+    ('sharpen', {}), ('emboss', {}),
+    ('cartoon', {'quality': 'full'}), ('cartoon', {'quality': 'balanced'}), ('cartoon', {'quality': 'fast'}),
+]
+
+def name(case: tuple) -> str:
+    effect, params = case
+    return '-'.join([effect] + ['%s=%s' % item for item in params.items()])
+
+def image(height: int, width: int) -> np.ndarray:
+    # noise over a gradient, so there are both flat areas and edges
+    rng = np.random.default_rng(height * width)
+    gradient = np.linspace(0, 200, width)[np.newaxis, :, np.newaxis] + np.linspace(0, 55, height)[:, np.newaxis, np.newaxis]
+    noise = rng.normal(0, 24, (height, width, 3))
+    return np.clip(gradient + noise, 0, 255).astype(np.uint8)
+
+def whole(pixels: np.ndarray, effect: str, params: dict) -> np.ndarray:
+    return getattr(Modifier(pixels=pixels), effect)(outputpath=None, **params).pixels
+
+def test_cases_cover_every_banded_effect() -> None:
+    assert set(Modifier._Modifier__HALO) == {effect for effect, params in CASES}
+
+@pytest.mark.parametrize('case', CASES, ids=name)
+def test_tiled_matches_whole(tmp_path, case: tuple) -> None:
+    pixels = image(523, 307)
+    np.save(tmp_path / 'input.npy', pixels)
+    # about 150 rows to a band, so every seam and the last partial band are crossed
+    Modifier.tiled(str(tmp_path / 'input.npy'), str(tmp_path / 'output.npy'), [case], budget=307 * 64 * 200)
+    np.testing.assert_array_equal(np.load(tmp_path / 'output.npy'), whole(pixels, *case))
+
+@pytest.mark.parametrize('extension', ['.png', '.tif', '.ppm'])
+def test_tiled_chain_streams_each_format(tmp_path, extension: str) -> None:
+    pixels = image(301, 203)
+    np.save(tmp_path / 'input.npy', pixels)
+    outputpath = str(tmp_path / ('output' + extension))
+    Modifier.tiled(str(tmp_path / 'input.npy'), outputpath, ['blur', 'sharpen', ('halftone', {'mode': 'ordered'})], budget=203 * 64 * 120)
+    expected = Modifier(pixels=pixels, lazy=True).blur(None).sharpen(None).halftone(None, mode='ordered').pixels
+    with Image.open(outputpath) as result:
+        np.testing.assert_array_equal(np.asarray(result.convert('RGB')), expected)
+
+@pytest.mark.parametrize('effect', ['detect_edges', ('halftone', {'mode': 'diffusion'}), ('dither', {'mode': 'diffusion'}), 'rotate'])
+def test_tiled_refuses(tmp_path, effect) -> None:
+    np.save(tmp_path / 'input.npy', image(64, 64))
+    with pytest.raises(ValueError, match='cannot run in bands'):
+        Modifier.tiled(str(tmp_path / 'input.npy'), str(tmp_path / 'output.npy'), [effect])
+
+@pytest.fixture(scope='module')
+def large() -> np.ndarray:
+    # past the megapixel set_threads splits images from
+    return image(1031, 1019)
+
+@pytest.fixture
+def threads():
+    Modifier.set_threads(4)
+    yield
+    Modifier.set_threads(1)
+
+@pytest.mark.parametrize('case', CASES + [('deepfry', {}), ('deepfry', {'strength': 2}), ('detect_edges', {})], ids=name)
+def test_threads_match_whole(large: np.ndarray, case: tuple, threads) -> None:
+    Modifier.set_threads(1)
+    expected = whole(large, *case)
+    Modifier.set_threads(4)
+    np.testing.assert_array_equal(whole(large, *case), expected)
+
+def test_threads_match_whole_chain(large: np.ndarray, threads) -> None:
+    def chain() -> np.ndarray:
+        return Modifier(pixels=large, lazy=True).tint(None).brightness(None, level=20).blur(None, radius=5).cartoon(None).pixels
+    threaded = chain()
+    Modifier.set_threads(1)
+    np.testing.assert_array_equal(threaded, chain())
@@ -0,0 +1,79 @@
+from PIL import Image
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier, ResultCache
+
+'''
+test_cache.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks that the result cache serves repeated saves without decoding, and keeps apart results that differ
+'''
+
+@pytest.fixture
+def photo(tmp_path) -> str:
+    path = str(tmp_path / 'photo.jpg')
+    pixels = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+    return path
+
+@pytest.fixture
+def cache():
+    cache = ResultCache(memory=2**24)
+    Modifier.use_cache(cache)
+    yield cache
+    Modifier.use_cache(None)
+
+def render(inputpath: str, outputpath: str, level: int = 20, **options) -> list:
+    # saves brightness(level) of inputpath, and returns the stages it ran
+    with Modifier.profile() as profile:
+        Modifier(inputpath, lazy=True).brightness(None, level=level).save(outputpath, **options)
+    return [record.stage for record in profile.records]
+
+def test_repeat_is_hit_without_decoding(tmp_path, photo: str, cache: ResultCache) -> None:
+    first = render(photo, str(tmp_path / 'first.png'))
+    second = render(photo, str(tmp_path / 'second.png'))
+    assert 'decode' in first and 'encode' in first
+    assert 'cache' in second and 'decode' not in second and 'encode' not in second
+    assert cache.stats()['memory_hits'] == 1
+    with open(tmp_path / 'first.png', 'rb') as first, open(tmp_path / 'second.png', 'rb') as second:
+        assert first.read() == second.read()
+
+@pytest.mark.parametrize('name, level, options', [
+    ('second.jpg', 40, {'quality': 90}),
+    ('second.jpg', 20, {'quality': 50}),
+    ('second.png', 20, {}),
+], ids=['params', 'options', 'format'])
+def test_differences_miss(tmp_path, photo: str, cache: ResultCache, name: str, level: int, options: dict) -> None:
+    render(photo, str(tmp_path / 'first.jpg'), quality=90)
+    stages = render(photo, str(tmp_path / name), level, **options)
+    assert 'decode' in stages and 'cache' not in stages
+    assert cache.stats()['hits'] == 0
+
+def test_changed_input_misses(tmp_path, photo: str, cache: ResultCache) -> None:
+    render(photo, str(tmp_path / 'first.png'))
+    Image.open(photo).rotate(90).save(photo)
+    assert 'decode' in render(photo, str(tmp_path / 'second.png'))
+
+def test_disk_survives_a_new_cache(tmp_path, photo: str) -> None:
+    Modifier.use_cache(ResultCache(memory=2**24, directory=str(tmp_path / 'cache')))
+    try:
+        render(photo, str(tmp_path / 'first.png'))
+        cache = ResultCache(memory=2**24, directory=str(tmp_path / 'cache'))
+        Modifier.use_cache(cache)
+        assert 'decode' not in render(photo, str(tmp_path / 'second.png'))
+        assert cache.stats()['disk_hits'] == 1
+    finally:
+        Modifier.use_cache(None)
@@ -0,0 +1,140 @@
+from PIL import Image
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier
+
+'''
+test_filters.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks the vectorized color filters against the original per-pixel loops
+'''
+
+# the original getpixel and putpixel loops, each returns the filtered copy of image
+
+def negative(image: Image) -> Image:
+    negative = image.copy()
+    for i in range(image.width):
+        for j in range(image.height):
+            r, g, b = image.getpixel((i, j))
+            negated = (255-r, 255-g, 255-b)
+            negative.putpixel((i, j), negated)
+    return negative
+
+def grayscale(image: Image) -> Image:
+    grayscale = image.copy()
+    for i in range(image.width):
+        for j in range(image.height):
+            r, g, b = image.getpixel((i, j))
+            gray = (r + g + b) // 3
+            grayed = (gray, gray, gray)
+            grayscale.putpixel((i, j), grayed)
+    return grayscale
+
+def sepia(image: Image) -> Image:
+    sepia = image.copy()
+    for i in range(image.width):
+        for j in range(image.height):
+            r, g, b = image.getpixel((i, j))
+            rn = (r*.393) + (g*.769) + (b*.189)
+            gn = (r*.349) + (g*.686) + (b*.168)
+            bn = (r*.272) + (g*.534) + (b*.131)
+            rn = 255 if rn > 255 else int(rn)
+            gn = 255 if gn > 255 else int(gn)
+            bn = 255 if bn > 255 else int(bn)
+            sepia.putpixel((i, j), (rn, gn, bn))
+    return sepia
+
+def primary(image: Image) -> Image:
+    primary = image.copy()
+    for i in range(primary.width):
+        for j in range(primary.height):
+            r, g, b = primary.getpixel((i, j))
+            r = 255 if r > 127 else 0
+            g = 255 if g > 127 else 0
+            b = 255 if b > 127 else 0
+            primary.putpixel((i, j), (r, g, b))
+    return primary
+
+def tint(image: Image) -> Image:
+    tint = image.copy()
+    for i in range(tint.width):
+        for j in range(tint.height):
+            r, g, b = tint.getpixel((i, j))
+            r = r + (.25 * (255-r))
+            g = g + (.25 * (255-g))
+            b = b + (.25 * (255-b))
+            tint.putpixel((i, j), (int(r), int(g), int(b)))
+    return tint
+
+def recolor(image: Image, dr: int = 100, dg: int = 100, db: int = 100) -> Image:
+    recolor = image.copy()
+    for i in range(recolor.width):
+        for j in range(recolor.height):
+            r, g, b = recolor.getpixel((i, j))
+            r += dr; g += dg; b += db
+            r, g, b = adjust_colors(r, g, b)
+            recolor.putpixel((i, j), (r, g, b))
+    return recolor
+
+def adjust_colors(r: int, g: int, b: int):
+    r = 255 if r > 255 else r
+    r = 0 if r < 0 else r
+    g = 255 if g > 255 else g
+    g = 0 if g < 0 else g
+    b = 255 if b > 255 else b
+    b = 0 if b < 0 else b
+    return r, g, b
+
+# odd sizes, so no row or column pairs up evenly
+SHAPES = [(1, 1), (7, 5), (33, 61)]
+
+@pytest.fixture(params=SHAPES, ids=lambda shape: '%dx%d' % shape)
+def pixels(request) -> np.ndarray:
+    height, width = request.param
+    pixels = np.random.default_rng(height * width).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    # every channel value shows up at least once
+    pixels.reshape(-1)[:256] = np.arange(min(256, pixels.size))
+    return pixels
+
+@pytest.mark.parametrize('effect, reference', [
+    ('negative', negative),
+    ('grayscale', grayscale),
+    ('sepia', sepia),
+    ('primary', primary),
+    ('tint', tint),
+])
+def test_matches_loop(pixels: np.ndarray, effect: str, reference) -> None:
+    expected = np.asarray(reference(Image.fromarray(pixels)))
+    result = getattr(Modifier(pixels=pixels), effect)(None).pixels
+    np.testing.assert_array_equal(result, expected)
+
+@pytest.mark.parametrize('dr, dg, db', [
+    (100, 100, 100),
+    (0, 0, 0),
+    (-50, 20, 255),
+    (-300, 400, -1),
+    (256, -256, 128),
+])
+def test_recolor_matches_loop(pixels: np.ndarray, dr: int, dg: int, db: int) -> None:
+    expected = np.asarray(recolor(Image.fromarray(pixels), dr, dg, db))
+    result = Modifier(pixels=pixels).recolor(None, dr=dr, dg=dg, db=db).pixels
+    np.testing.assert_array_equal(result, expected)
+
+def test_lazy_chain_matches_loops(pixels: np.ndarray) -> None:
+    # the point filters fuse into one table when chained, which must not change the result
+    expected = np.asarray(tint(sepia(recolor(negative(Image.fromarray(pixels)), -40, 10, 70))))
+    result = Modifier(pixels=pixels, lazy=True).negative(None).recolor(None, dr=-40, dg=10, db=70).sepia(None).tint(None).pixels
+    np.testing.assert_array_equal(result, expected)
@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier, BufferPool
+
+'''
+test_pool.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks that reusing buffers from a pool never changes a result
+'''
+
+EFFECTS = [effect for effect in Modifier.effects() if effect != 'curve']
+
+def image(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (61, 47, 3), dtype=np.uint8)
+
+@pytest.fixture
+def pool():
+    pool = BufferPool()
+    Modifier.use_pool(pool)
+    yield pool
+    Modifier.use_pool(None)
+
+def chain(pixels: np.ndarray, effects: list) -> np.ndarray:
+    chained = Modifier(pixels=pixels, lazy=True)
+    for effect in effects:
+        chained = getattr(chained, effect)(None)
+    return chained.pixels
+
+@pytest.mark.parametrize('effect', EFFECTS)
+def test_pooled_matches_unpooled(pool: BufferPool, effect: str) -> None:
+    Modifier.use_pool(None)
+    expected = getattr(Modifier(pixels=image()), effect)(None).pixels
+    Modifier.use_pool(pool)
+    # the later runs take buffers the earlier ones released, holding another image's pixels
+    for seed in (1, 2, 0):
+        Modifier(pixels=image(seed)).blur(None).negative(None).release()
+        result = getattr(Modifier(pixels=image(seed)), effect)(None)
+        pixels = np.array(result.pixels)
+        result.release()
+    np.testing.assert_array_equal(pixels, expected)
+
+def test_pooled_chain_matches_unpooled(pool: BufferPool) -> None:
+    effects = ['tint', 'mirror_vertical', 'blur', 'rotate', 'sharpen', 'brightness', 'cartoon', 'halftone']
+    Modifier.use_pool(None)
+    expected = chain(image(), effects)
+    Modifier.use_pool(pool)
+    for _ in range(3):
+        result = chain(image(), effects)
+        np.testing.assert_array_equal(result, expected)
+    assert pool.stats()['hits'] > 0
+
+def test_release_keeps_derived_pixels(pool: BufferPool) -> None:
+    parent = Modifier(pixels=image()).blur(None)
+    mirrored = parent.mirror_vertical(None)
+    rotated = parent.pipeline().rotate(None, degree=90)
+    expected = (np.array(mirrored.pixels), np.array(rotated.pixels))
+    parent.release()
+    for seed in (1, 2, 3):
+        Modifier(pixels=image(seed)).blur(None).sharpen(None).release()
+    np.testing.assert_array_equal(mirrored.pixels, expected[0])
+    np.testing.assert_array_equal(rotated.pixels, expected[1])
+
+def test_pool_keeps_arrays_it_did_not_lend(pool: BufferPool) -> None:
+    pixels = image()
+    kept = pixels.copy()
+    Modifier(pixels=pixels).release()
+    pool.give(pixels)
+    assert not pool.lends(pixels) and pool.stats()['buffers'] == 0
+    Modifier(pixels=image(1)).negative(None).release()
+    np.testing.assert_array_equal(pixels, kept)
+
+def test_inplace_writes_into_the_given_array(pool: BufferPool) -> None:
+    pixels = image()
+    expected = 255 - pixels
+    Modifier(pixels=pixels, inplace=True).negative(None)
+    np.testing.assert_array_equal(pixels, expected)
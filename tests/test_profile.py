@@ -0,0 +1,43 @@
+import io
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier
+
+'''
+test_profile.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks that profiling a modifier does not change what it writes
+'''
+
+class Pipe(io.RawIOBase):
+    # a writer that cannot seek or tell its position, as a pipe, socket or HTTP response
+    def __init__(self):
+        self.data = bytearray()
+    def writable(self) -> bool:
+        return True
+    def write(self, data) -> int:
+        self.data += data
+        return len(data)
+
+def test_profiled_save_to_pipe() -> None:
+    pixels = np.random.default_rng(0).integers(0, 256, (40, 30, 3), dtype=np.uint8)
+    plain = Pipe()
+    Modifier(pixels=pixels).negative(None).save(plain, format='PNG')
+    profiled = Pipe()
+    with Modifier.profile() as profile:
+        Modifier(pixels=pixels).negative(None).save(profiled, format='PNG')
+    assert profiled.data == plain.data
+    encodes = [record for record in profile.records if record.stage == 'encode']
+    assert [record.bytes for record in encodes] == [len(plain.data)]
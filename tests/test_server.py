@@ -0,0 +1,117 @@
+from PIL import Image
+import io
+import os
+import sys
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modifier import Modifier
+from server import make_server
+
+'''
+test_server.py
+Copyright 2021 RandomKiddo
+
+This work is license under the LaTeX Project Public License v1.3c or newer.
+By the definition of this license, all work may be modified and distributed,
+as defined by the terms of the license.
+For more details, see: http://www.latex-project.org/lppl.txt
+
+This work has the LPPL maintenance status `maintained`
+The current maintainer of this work is RandomKiddo
+
+Checks the HTTP service of server.py on localhost
+'''
+
+@pytest.fixture(scope='module')
+def url():
+    server = make_server(port=0, workers=2, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://%s:%d' % server.server_address[:2]
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+@pytest.fixture(scope='module')
+def photo() -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def post(url: str, path: str, body: bytes) -> tuple:
+    # (status, headers, body) of a POST
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url + path, body)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+def status(url: str) -> dict:
+    with urllib.request.urlopen(url + '/status') as response:
+        return json.loads(response.read())
+
+def test_result_matches_local_render(url: str, photo: bytes) -> None:
+    code, headers, body = post(url, '/blur?radius=5&format=png', photo)
+    assert code == 200 and headers['Content-Type'] == 'image/png'
+    expected = Modifier(image=Image.open(io.BytesIO(photo)), lazy=True).blur(None, radius=5).to_bytes('PNG')
+    assert body == expected
+
+def test_identical_requests_coalesce(url: str, photo: bytes) -> None:
+    before = status(url)
+    barrier = threading.Barrier(8)
+    results = []
+    def request() -> None:
+        barrier.wait()
+        results.append(post(url, '/cartoon?format=png', photo))
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(code == 200 for code, headers, body in results)
+    assert len({body for code, headers, body in results}) == 1
+    coalesced = [headers['X-Coalesced'] for code, headers, body in results].count('true')
+    assert coalesced > 0
+    after = status(url)
+    assert after['requests'] - before['requests'] == 8
+    assert after['coalesced'] - before['coalesced'] == coalesced
+    assert after['computed'] - before['computed'] == 8 - coalesced
+
+@pytest.mark.parametrize('path, body, code', [
+    ('/negative', b'not an image', 400),
+    ('/negative', b'', 400),
+    ('/brightness?level=abc', None, 400),
+    ('/blur?outputpath=x.jpg', None, 400),
+    ('/black_border?width=-5', None, 400),
+    ('/nothing', None, 404),
+])
+def test_bad_requests(url: str, photo: bytes, path: str, body: bytes, code: int) -> None:
+    assert post(url, path, photo if body is None else body)[0] == code
+
+@pytest.mark.parametrize('length', ['abc', '-5'])
+def test_bad_content_length(url: str, length: str) -> None:
+    host, port = url[len('http://'):].split(':')
+    with socket.create_connection((host, int(port)), timeout=10) as connection:
+        connection.sendall(('POST /negative HTTP/1.1\r\nHost: x\r\nContent-Length: %s\r\n\r\n' % length).encode())
+        assert connection.recv(4096).startswith(b'HTTP/1.1 400 ')
+
+def test_status_adds_up(url: str, photo: bytes) -> None:
+    before = status(url)
+    post(url, '/negative', b'not an image')
+    post(url, '/sepia?format=png', photo)
+    after = status(url)
+    assert after['requests'] - before['requests'] == 2
+    assert after['errors'] - before['errors'] == 1
+    assert after['requests'] == after['computed'] + after['coalesced']
+    assert after['waiting_requests'] == 0 and after['in_progress'] == 0 and after['queue_depth'] == 0
+    assert after['latency_ms']['count'] == after['requests']
+    assert after['workers'] == 2 and after['restarts'] == 0
+    assert 0 <= after['worker_utilization'] <= 1